@@ -1,39 +1,105 @@
-import requests
-from urllib3 import encode_multipart_formdata
+import hashlib
+import aiohttp
 import app.config as config
+from app import http_client
+from app.cache import TTLCache
 from fastapi import Request, HTTPException
 
-async def verify_token(username: str, token: str):
+# Cache of recent verification results from the auth server
+_verification_cache = None
+
+def get_verification_cache() -> TTLCache:
     """
-    Verify the provided token for a given username by making a request to the authentication server.
-    Args:
-        username (str): The username to verify the token for.
-        token (str): The token to be verified.
+    Get the token verification cache, creating it on first use.
     Returns:
-        str: The status of the token verification. Returns True if authentication was successful.
-    Raises:
-        requests.exceptions.RequestException: If there is an issue with the HTTP request.
-        InvalidToken: If the token is invalid.
+        TTLCache: The verification cache.
+    """
+    global _verification_cache
+
+    if _verification_cache is None:
+        _verification_cache = TTLCache(
+            maxsize=config.get_config('auth-cache-size'),
+            ttl=config.get_config('auth-cache-ttl'),
+        )
+
+    return _verification_cache
+
+def get_verification_cache_stats() -> dict:
     """
+    Get hit/miss metrics for the token verification cache.
+    Returns:
+        dict: The cache metrics.
+    """
+    return get_verification_cache().stats()
+
+def _verification_ttl(status: int):
+    # Cache successful verifications and definitive rejections
+    # Anything else (auth server errors) is retried on the next request
+    if status == 200:
+        return config.get_config('auth-cache-ttl')
+    elif status in (401, 403):
+        return config.get_config('auth-cache-negative-ttl')
+    else:
+        return None
+
+async def _request_verification(username: str, token: str) -> int:
     # Create form data for request
-    request_body, content_type = encode_multipart_formdata([
-        ('username', username),
-        ('token', token),
-    ])
+    request_body = aiohttp.MultipartWriter('form-data')
+
+    for name, value in (('username', username), ('token', token)):
+        part = request_body.append(value)
+        part.set_content_disposition('form-data', name=name)
 
     # Get auth server url from config
     auth_server_url = config.get_config('auth-server-url')
 
     # Make auth request to server
-    response = requests.post(
-        url=f"{auth_server_url}/auth/verify_token",
-        headers={'Content-Type': content_type},
+    session = http_client.get_session()
+
+    async with session.post(
+        f"{auth_server_url}/auth/verify_token",
         data=request_body,
-        timeout=10
+        timeout=http_client.get_timeout('auth')
+    ) as response:
+        return response.status
+
+async def get_verification_status(username: str, token: str) -> int:
+    """
+    Get the auth server's verification status for a username and token.
+    Results are cached and concurrent verifications of the same credentials share one request.
+    Args:
+        username (str): The username to verify the token for.
+        token (str): The token to be verified.
+    Returns:
+        int: The HTTP status code returned by the auth server.
+    Raises:
+        aiohttp.ClientError: If there is an issue with the HTTP request.
+    """
+    # Key on a hash so raw tokens are not kept in memory
+    key = (username, hashlib.sha256(token.encode()).hexdigest())
+
+    return await get_verification_cache().get_or_load(
+        key,
+        lambda: _request_verification(username, token),
+        ttl=_verification_ttl
     )
 
+async def verify_token(username: str, token: str):
+    """
+    Verify the provided token for a given username by making a request to the authentication server.
+    Args:
+        username (str): The username to verify the token for.
+        token (str): The token to be verified.
+    Returns:
+        str: The status of the token verification. Returns True if authentication was successful.
+    Raises:
+        aiohttp.ClientError: If there is an issue with the HTTP request.
+        InvalidToken: If the token is invalid.
+    """
+    status = await get_verification_status(username, token)
+
     # Check request status code
-    if response.status_code == 200:
+    if status == 200:
         return True
     else:
         raise InvalidToken
@@ -41,7 +107,7 @@ async def verify_token(username: str, token: str):
 class InvalidToken(Exception):
     pass
 
-def useAuth(request: Request) -> tuple[str, str]:
+async def useAuth(request: Request) -> tuple[str, str]:
     """
     Verify user credentials from request data.
     Args:
@@ -50,7 +116,7 @@ def useAuth(request: Request) -> tuple[str, str]:
         username,token (str,str): Auth details for the account.
     Raises:
         fastapi.HTTPException: Problem with the authentication.
-        requests.exceptions.RequestException: If there is an issue with the HTTP request.
+        aiohttp.ClientError: If there is an issue with the HTTP request.
     """
     # Get auth headers
     username = request.headers.get("username")
@@ -63,25 +129,8 @@ def useAuth(request: Request) -> tuple[str, str]:
             detail="\"username\" and \"token\" headers are required."
         )
 
-    # Create form data for request
-    request_body, content_type = encode_multipart_formdata([
-        ('username', username),
-        ('token', token),
-    ])
-
-    # Get auth server url from config
-    auth_server_url = config.get_config('auth-server-url')
-
-    # Make auth request to server
-    response = requests.post(
-        url=f"{auth_server_url}/auth/verify_token",
-        headers={'Content-Type': content_type},
-        data=request_body,
-        timeout=10
-    )
-
     # Check auth response
-    status = response.status_code
+    status = await get_verification_status(username, token)
     if status == 200:
         return username, token
     elif status == 401:
@@ -98,4 +147,4 @@ def useAuth(request: Request) -> tuple[str, str]:
         raise HTTPException(
             status_code=500,
             detail="Internal server error."
-        )
\ No newline at end of file
+        )
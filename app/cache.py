@@ -0,0 +1,176 @@
+from collections import OrderedDict
+import asyncio
+import time
+
+# Result given to coalesced callers when the caller running the load is cancelled
+_ABANDONED = object()
+
+class TTLCache:
+    """
+    Bounded in-memory cache with per-entry expiry and LRU eviction.
+    Concurrent loads of the same missing key are coalesced into a single call.
+    """
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+        # Cache metrics
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "evictions": 0,
+        }
+
+    def get(self, key, default=None):
+        """
+        Get a value from the cache.
+        Args:
+            key (hashable): The cache key.
+            default (any): Value to return if the key is missing or expired.
+        Returns:
+            any: The cached value or the default.
+        """
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self._metrics['misses'] += 1
+            return default
+
+        value, expires = entry
+
+        if expires <= time.monotonic():
+            del self._entries[key]
+            self._metrics['misses'] += 1
+            return default
+
+        # Mark entry as recently used
+        self._entries.move_to_end(key)
+        self._metrics['hits'] += 1
+
+        return value
+
+    def set(self, key, value, ttl: float = None) -> None:
+        """
+        Add a value to the cache, evicting the least recently used entry if full.
+        Args:
+            key (hashable): The cache key.
+            value (any): The value to cache.
+            ttl (float): Seconds until the entry expires. Defaults to the cache TTL.
+        Returns:
+            None
+        """
+        if ttl is None:
+            ttl = self.ttl
+
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self._metrics['evictions'] += 1
+
+    def invalidate(self, key) -> None:
+        """
+        Remove a value from the cache.
+        A load for the key that is already running will not cache its result.
+        Args:
+            key (hashable): The cache key.
+        Returns:
+            None
+        """
+        self._entries.pop(key, None)
+        self._inflight.pop(key, None)
+
+    def clear(self) -> None:
+        """
+        Remove every value from the cache.
+        Returns:
+            None
+        """
+        self._entries.clear()
+
+    async def get_or_load(self, key, loader, ttl=None):
+        """
+        Get a value from the cache, loading it if missing.
+        If a load for the same key is already running, wait for it instead of starting another.
+        Args:
+            key (hashable): The cache key.
+            loader (callable): Coroutine function that returns the value to cache.
+            ttl (float | callable): Seconds the value stays cached, or a function that takes
+                the loaded value and returns the seconds to cache it for (0 or None skips caching).
+                Defaults to the cache TTL.
+        Returns:
+            any: The cached or loaded value.
+        """
+        missing = object()
+
+        while True:
+            value = self.get(key, missing)
+
+            if value is not missing:
+                return value
+
+            # Join a load that is already in progress
+            future = self._inflight.get(key)
+
+            if future is None:
+                break
+
+            self._metrics['coalesced'] += 1
+            value = await asyncio.shield(future)
+
+            # The load was abandoned, so take it over or join whoever did
+            if value is not _ABANDONED:
+                return value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+
+        try:
+            value = await loader()
+        except asyncio.CancelledError:
+            # Only this caller was cancelled, so let the coalesced callers retry the load
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+            future.set_result(_ABANDONED)
+            raise
+        except Exception as error:
+            future.set_exception(error)
+
+            # Mark the exception as retrieved in case nobody else was waiting
+            future.exception()
+            raise
+        else:
+            if ttl is None:
+                entry_ttl = self.ttl
+            elif callable(ttl):
+                entry_ttl = ttl(value)
+            else:
+                entry_ttl = ttl
+
+            # Skip caching if the key was invalidated while loading
+            if entry_ttl and self._inflight.get(key) is future:
+                self.set(key, value, entry_ttl)
+
+            future.set_result(value)
+            return value
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def stats(self) -> dict:
+        """
+        Get hit/miss metrics for the cache.
+        Returns:
+            dict: The cache metrics.
+        """
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            **self._metrics,
+        }
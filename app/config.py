@@ -1,5 +1,8 @@
 import os
 import yaml
+import asyncio
+import threading
+from types import MappingProxyType
 
 # Define default values for the config
 config_template = {
@@ -10,11 +13,53 @@ config_template = {
     "mysql-database": "Lif_Accounts",
     "mysql-ssl": False,
     "mysql-cert-path": "INSERT PATH HERE",
+    "mysql-pool-size": 10,
+    "mysql-pool-timeout": 10,
+    "mysql-pool-max-lifetime": 3600,
+    "mysql-pool-ping-interval": 30,
+    "mysql-max-concurrency": 10,
+    "run-migrations-on-startup": True,
+    "messages-page-size": 20,
+    "messages-max-page-size": 100,
     "auth-server-url": "INSERT URL HERE",
+    "auth-cache-size": 10000,
+    "auth-cache-ttl": 60,
+    "auth-cache-negative-ttl": 10,
+    "http-max-connections": 100,
+    "http-max-connections-per-host": 20,
+    "http-keepalive-timeout": 30,
     "safe-browsing-api-key": "INSERT API KEY HERE",
-    "giphy-api-key": "INSERT API KEY HERE"
+    "giphy-api-key": "INSERT API KEY HERE",
+    "websocket-queue-size": 100,
+    "websocket-overflow-policy": "drop_oldest",
+    "live-updates-backend": "local",
+    "redis-url": "redis://localhost:6379/0",
+    "config-reload-interval": 5,
+    "self-destruct-window": 60,
+    "self-destruct-batch-size": 500,
+    "view-batch-window": 0.25,
+    "message-batch-max-latency": 0.005,
+    "message-batch-size": 100,
+    "members-cache-size": 10000,
+    "members-cache-ttl": 300,
+    "expo-push-url": "https://exp.host/--/api/v2/push/send",
+    "push-outbox-path": "push_outbox.db",
+    "push-outbox-max-size": 100000,
+    "push-outbox-dedupe-ttl": 3600,
+    "expo-receipts-url": "https://exp.host/--/api/v2/push/getReceipts",
+    "push-token-sweep-interval": 300,
+    "push-coalesce-window": 3,
+    "push-token-cache-size": 10000,
+    "push-token-cache-ttl": 300,
+    "push-max-concurrency": 4,
+    "push-max-retries": 5
 }
 
+# Immutable snapshot of the loaded configurations
+_snapshot = None
+_snapshot_mtime = None
+_snapshot_lock = threading.Lock()
+
 def init_config():
     """
     Initialize the config file with default values if it doesn't exist.
@@ -49,22 +94,81 @@ def init_config():
             config.write(new_config)
             config.close()
 
+    # Load the configurations into memory
+    reload_config()
+
+def reload_config() -> bool:
+    """
+    Reload the config file into the in-memory snapshot.
+    Returns:
+        bool: True if the configurations changed.
+    """
+    global _snapshot, _snapshot_mtime
+
+    with _snapshot_lock:
+        mtime = os.path.getmtime("config.yml")
+
+        # Load the config file
+        with open("config.yml", "r") as config:
+            contents = config.read()
+            configurations = yaml.safe_load(contents)
+            config.close()
+
+        # Ensure the configurations are not None
+        if configurations is None:
+            configurations = {}
+
+        changed = _snapshot is None or dict(_snapshot) != configurations
+
+        _snapshot = MappingProxyType(configurations)
+        _snapshot_mtime = mtime
+
+    return changed
+
+def _reload_if_modified() -> None:
+    try:
+        mtime = os.path.getmtime("config.yml")
+    except OSError:
+        return
+
+    if mtime != _snapshot_mtime:
+        reload_config()
+
+async def watch_config() -> None:
+    """
+    Reload the configurations whenever the config file is modified.
+    Polls the file modification time every "config-reload-interval" seconds.
+    Does nothing if the interval is 0.
+    """
+    while True:
+        interval = get_config('config-reload-interval')
+
+        if not interval:
+            return
+
+        await asyncio.sleep(interval)
+
+        # Read and parse the file off the event loop
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, _reload_if_modified)
+        except Exception as e:
+            print(f"Failed to reload config: {e}")
+
 def get_config(key: str = None):
     """
-    Load the config file and return the configurations.
+    Get the configurations from the in-memory snapshot.
+    The config file is only read on first use and on reload.
     Parameters:
         key (str): Optional key to retrieve a specific configuration value.
     Returns:
         dict or any: The configurations dictionary or a specific value if key is provided.
     """
-    # Load the config file and return the configurations
-    with open("config.yml", "r") as config:
-        contents = config.read()
-        configurations = yaml.safe_load(contents)
-        config.close()
+    # Load the config file if it hasn't been loaded yet
+    if _snapshot is None:
+        reload_config()
 
     # If a key is provided, return the specific configuration value
     if key is not None:
-        return configurations.get(key, None)
+        return _snapshot.get(key, None)
     
-    return configurations
\ No newline at end of file
+    return _snapshot
@@ -1,12 +1,272 @@
 import mysql.connector
 from mysql.connector import ClientFlag
 from app.config import get_config
+import threading
+import time
 
-def get_connection():
+class PoolExhausted(Exception):
+    """Error for when no database connection became available before the pool timeout."""
+    pass
+
+class PooledConnection:
+    """
+    Wrapper around a MySQL connection that is owned by a ConnectionPool.
+    Calling close() returns the connection to the pool instead of closing it,
+    and using it as a context manager returns it when the block exits.
+    """
+    def __init__(self, pool: "ConnectionPool", connection) -> None:
+        self._pool = pool
+        self._connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.checked_out = False
+
+    def __getattr__(self, name):
+        # Proxy everything else to the underlying connection
+        return getattr(self._connection, name)
+
+    def __del__(self):
+        # A borrower dropped the connection without closing it
+        # Discard it so the pool does not lose track of a slot
+        if self.checked_out:
+            self.checked_out = False
+            self._pool._discard(self)
+
+    def __enter__(self) -> "PooledConnection":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        # Return the connection even if the block raised
+        # Any open transaction is rolled back by the pool
+        self.close()
+
+    def close(self) -> None:
+        """
+        Return the connection to the pool.
+        Returns:
+            None
+        """
+        if self.checked_out:
+            self.checked_out = False
+            self._pool.release(self)
+
+class ConnectionPool:
     """
-    Establish a connection to the MySQL database using the configurations from config.py.
+    Fixed size pool of MySQL connections.
+    Connections are created lazily, health checked when they have been idle for a while
+    and recycled once they are older than the configured max lifetime.
     """
+    def __init__(
+        self,
+        mysql_config: dict,
+        size: int,
+        timeout: float,
+        max_lifetime: float,
+        ping_interval: float
+    ) -> None:
+        self._mysql_config = mysql_config
+        self.size = size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.ping_interval = ping_interval
+
+        # Idle connections, most recently used last
+        self._idle = []
+        self._lock = threading.RLock()
+
+        # Notified whenever a connection is released or a slot is freed
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+
+        # Number of connections currently owned by the pool (idle and in use)
+        self._open = 0
+
+        # Pool metrics
+        self._metrics = {
+            "created": 0,
+            "recycled": 0,
+            "health_check_failures": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+        }
+
+    def _connect(self) -> PooledConnection:
+        connection = mysql.connector.connect(**self._mysql_config)
+
+        with self._lock:
+            self._metrics['created'] += 1
+
+        return PooledConnection(self, connection)
+
+    def _discard(self, connection: PooledConnection) -> None:
+        try:
+            connection._connection.close()
+        except Exception:
+            pass
+
+        # Wake a waiter so it can open a connection in the freed slot
+        with self._available:
+            self._open -= 1
+            self._available.notify()
+
+    def _is_healthy(self, connection: PooledConnection) -> bool:
+        now = time.monotonic()
+
+        # Recycle connections that have been open for too long
+        if self.max_lifetime and now - connection.created_at > self.max_lifetime:
+            with self._lock:
+                self._metrics['recycled'] += 1
+            return False
+
+        # Only ping connections that have been idle for a while
+        if now - connection.last_used > self.ping_interval:
+            try:
+                connection._connection.ping(reconnect=False)
+            except Exception:
+                with self._lock:
+                    self._metrics['health_check_failures'] += 1
+                return False
+
+        return True
+
+    def acquire(self) -> PooledConnection:
+        """
+        Borrow a connection from the pool.
+        Blocks for up to the pool timeout if every connection is in use.
+        Returns:
+            PooledConnection: A healthy connection.
+        Raises:
+            PoolExhausted: No connection became available in time.
+        """
+        deadline = time.monotonic() + self.timeout
+        waited = False
+
+        while True:
+            with self._available:
+                while True:
+                    if self._closed:
+                        raise PoolExhausted("Connection pool is closed.")
+
+                    # Prefer an idle connection
+                    if self._idle:
+                        connection = self._idle.pop()
+                        break
+
+                    # Open a new connection if the pool has room for one
+                    if self._open < self.size:
+                        self._open += 1
+                        connection = None
+                        break
+
+                    # Otherwise wait for a connection to be released or a slot to be freed
+                    if not waited:
+                        waited = True
+                        self._metrics['waits'] += 1
+
+                    remaining = deadline - time.monotonic()
+
+                    if remaining <= 0:
+                        self._metrics['timeouts'] += 1
+                        raise PoolExhausted(f"No database connection available after {self.timeout} seconds.")
+
+                    self._available.wait(remaining)
+
+            if connection is None:
+                try:
+                    connection = self._connect()
+                except Exception:
+                    with self._available:
+                        self._open -= 1
+                        self._available.notify()
+                    raise
+                break
+
+            if self._is_healthy(connection):
+                break
 
+            self._discard(connection)
+
+        with self._lock:
+            self._metrics['checkouts'] += 1
+
+        connection.checked_out = True
+        return connection
+
+    def release(self, connection: PooledConnection) -> None:
+        """
+        Return a connection to the pool.
+        Any open transaction is rolled back so the next borrower starts clean.
+        Args:
+            connection (PooledConnection): The connection to return.
+        Returns:
+            None
+        """
+        if self._closed:
+            self._discard(connection)
+            return
+
+        try:
+            if connection._connection.in_transaction:
+                connection._connection.rollback()
+        except Exception:
+            self._discard(connection)
+            return
+
+        connection.last_used = time.monotonic()
+
+        with self._available:
+            # The pool may have been closed while the connection was rolled back
+            if not self._closed:
+                self._idle.append(connection)
+                self._available.notify()
+                return
+
+        self._discard(connection)
+
+    def close(self) -> None:
+        """
+        Close every idle connection and stop handing out new ones.
+        Connections that are still in use are closed when they are released.
+        Returns:
+            None
+        """
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+
+            # Waiters fail fast instead of sleeping until their timeout
+            self._available.notify_all()
+
+        for connection in idle:
+            self._discard(connection)
+
+    def stats(self) -> dict:
+        """
+        Get pool usage and exhaustion metrics.
+        Returns:
+            dict: The pool metrics.
+        """
+        with self._lock:
+            idle = len(self._idle)
+
+            return {
+                "size": self.size,
+                "open": self._open,
+                "idle": idle,
+                "in_use": self._open - idle,
+                **self._metrics,
+            }
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_mysql_config() -> dict:
+    """
+    Get the MySQL connection parameters from the configurations in config.py.
+    Returns:
+        dict: Keyword arguments for mysql.connector.connect().
+    """
     # Load the configuration
     config = get_config()
 
@@ -16,7 +276,9 @@ def get_connection():
         "port": config['mysql-port'],
         "user": config['mysql-user'],
         "password": config['mysql-password'],
-        "database": config['mysql-database'], 
+        "database": config['mysql-database'],
+        # Buffer results so a connection can be reused without leftover rows
+        "buffered": True,
     }
 
     # Check if SSL is enabled
@@ -25,7 +287,57 @@ def get_connection():
         mysql_config['client_flags'] = [ClientFlag.SSL]
         mysql_config['ssl_ca'] = config['mysql-cert-path']
 
-    # Create a connection to the database
-    connection = mysql.connector.connect(**mysql_config)
+    return mysql_config
 
-    return connection
\ No newline at end of file
+def get_pool() -> ConnectionPool:
+    """
+    Get the application connection pool, creating it on first use.
+    Returns:
+        ConnectionPool: The connection pool.
+    """
+    global _pool
+
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                config = get_config()
+
+                _pool = ConnectionPool(
+                    mysql_config=get_mysql_config(),
+                    size=config['mysql-pool-size'],
+                    timeout=config['mysql-pool-timeout'],
+                    max_lifetime=config['mysql-pool-max-lifetime'],
+                    ping_interval=config['mysql-pool-ping-interval'],
+                )
+
+    return _pool
+
+def close_pool() -> None:
+    """
+    Close the application connection pool if it was created.
+    Returns:
+        None
+    """
+    global _pool
+
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def get_pool_stats() -> dict:
+    """
+    Get metrics for the application connection pool.
+    Returns:
+        dict: The pool metrics.
+    """
+    return get_pool().stats()
+
+def get_connection() -> PooledConnection:
+    """
+    Borrow a connection to the MySQL database from the connection pool.
+    Calling close() on the connection returns it to the pool.
+    Raises:
+        PoolExhausted: No connection became available before the pool timeout.
+    """
+    return get_pool().acquire()
@@ -1,82 +1,161 @@
 from app.database.connections import get_connection
+from app.database.executor import run_in_executor
+from app.cache import TTLCache
+from app.websocket import bus
 import app.database.exceptions as exceptions
-import json
+import app.config as config
+
+# Bus channel used to drop members that other workers have cached
+MEMBERS_CHANNEL = "members_cache"
+
+# Cache of conversation members, since membership almost never changes
+_members_cache = None
+
+def get_members_cache() -> TTLCache:
+    """
+    Get the conversation members cache, creating it on first use.
+    Returns:
+        TTLCache: The members cache.
+    """
+    global _members_cache
+
+    if _members_cache is None:
+        _members_cache = TTLCache(
+            maxsize=config.get_config('members-cache-size'),
+            ttl=config.get_config('members-cache-ttl'),
+        )
+
+    return _members_cache
+
+def get_members_cache_stats() -> dict:
+    """
+    Get hit/miss metrics for the conversation members cache.
+    Returns:
+        dict: The cache metrics.
+    """
+    return get_members_cache().stats()
+
+def _drop_members(conversation_ids: list, frame: str = None) -> None:
+    for conversation_id in conversation_ids:
+        get_members_cache().invalidate(conversation_id)
+
+# Receive invalidations published by other workers and nodes
+bus.subscribe(MEMBERS_CHANNEL, _drop_members)
+
+async def invalidate_members(conversation_ids: list) -> None:
+    """
+    Drop cached members on every worker after membership changes.
+    Membership is used for permission checks, so other workers must not keep serving it until it expires.
+    Args:
+        conversation_ids (list): The conversations whose members changed.
+    Returns:
+        None
+    """
+    _drop_members(conversation_ids)
+
+    try:
+        await bus.publish(MEMBERS_CHANNEL, conversation_ids, "")
+    except Exception as e:
+        print(f"Failed to publish members invalidation to bus: {e}")
 
 async def get_members(conversation_id: str) -> list:
-    # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    """
+    Get the members of a conversation in the order they were added.
+    Members are cached after the first read.
+    Args:
+        conversation_id (str): The identifier for the conversation.
+    Raises:
+        ConversationNotFound: If the conversation does not exist.
+    Returns:
+        list: The usernames of the members.
+    """
+    members = await get_members_cache().get_or_load(
+        conversation_id,
+        lambda: _load_members(conversation_id)
+    )
+
+    # Cached as a tuple, so hand out a copy callers can change
+    return list(members)
 
-    # Gets all data from the database
-    cursor.execute("SELECT * FROM conversations WHERE conversation_id = %s", (conversation_id,))
-    conversation = cursor.fetchone()
-    conn.close()
+@run_in_executor
+def _load_members(conversation_id: str) -> tuple:
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Check if conversation exists
-    if not conversation:
+        # Get conversation members in the order they were added
+        cursor.execute("""
+            SELECT account FROM conversation_members
+            WHERE conversation_id = %s
+            ORDER BY id
+        """, (conversation_id,))
+        members = cursor.fetchall()
+
+    # Every conversation has members, so no rows means it doesn't exist
+    if not members:
         raise exceptions.ConversationNotFound()
 
-    # Get and return conversation members
-    members = json.loads(conversation[2])
-    return members
+    return tuple(member[0] for member in members)
 
 async def remove_conversation(conversation_id: str, username: str) -> None:
-    # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    """
+    Remove a conversation, its messages and its members.
+    Args:
+        conversation_id (str): The identifier for the conversation.
+        username (str): The member removing the conversation.
+    Raises:
+        ConversationNotFound: If the conversation does not exist.
+        NoPermission: If the user is not a member of the conversation.
+    Returns:
+        None
+    """
+    await _remove_conversation(conversation_id, username)
 
-    # Get conversation
-    cursor.execute("SELECT * FROM conversations WHERE conversation_id = %s", (conversation_id,))
-    conversation = cursor.fetchone()
+    await invalidate_members([conversation_id])
 
-    # Check if conversation exists
-    if not conversation:
-        conn.close()
-        raise exceptions.ConversationNotFound()
-    
-    # Get conversation members
-    conversation_members = json.loads(conversation[2])
+@run_in_executor
+def _remove_conversation(conversation_id: str, username: str) -> None:
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Check if user is a member of this conversation
-    if not username in conversation_members:
-        conn.close()
-        raise exceptions.NoPermission()
-    
-    # Delete conversation
-    cursor.execute("DELETE FROM conversations WHERE conversation_id = %s", (conversation_id,))
-    conn.commit()
+        # Get conversation
+        cursor.execute("SELECT conversation_id FROM conversations WHERE conversation_id = %s", (conversation_id,))
+        conversation = cursor.fetchone()
 
-    # Delete conversation messages
-    cursor.execute("DELETE FROM messages WHERE conversation_id = %s", (conversation_id,))
-    conn.commit()
+        # Check if conversation exists
+        if not conversation:
+            raise exceptions.ConversationNotFound()
 
-    # For each member, remove conversation from friends
-    for member in conversation_members:
-        # Get member account
-        cursor.execute("SELECT * FROM users WHERE account = %s", (member,))
-        member_account = cursor.fetchone()
+        # Check if user is a member of this conversation
+        cursor.execute("""
+            SELECT 1 FROM conversation_members
+            WHERE conversation_id = %s AND account = %s
+        """, (conversation_id, username))
 
-        # Get member friends
-        member_friends = json.loads(member_account[3])
+        if not cursor.fetchone():
+            raise exceptions.NoPermission()
+    
+        # Delete conversation
+        cursor.execute("DELETE FROM conversations WHERE conversation_id = %s", (conversation_id,))
+        conn.commit()
 
-        # Keep track of list index
-        index = 0
+        # Delete conversation messages
+        cursor.execute("DELETE FROM messages WHERE conversation_id = %s", (conversation_id,))
+        conn.commit()
 
-        # Remove conversation
-        for friend in member_friends:
-            if friend["Id"] == conversation_id:
-                member_friends.remove(member_friends[index])
+        # Remove conversation members
+        cursor.execute("DELETE FROM conversation_members WHERE conversation_id = %s", (conversation_id,))
 
-                # Update member friends
-                cursor.execute("UPDATE users SET friends = %s WHERE account = %s", (json.dumps(member_friends), member))
-                conn.commit()
-            else:
-                index += 1
+        # Remove conversation from the friends of each member
+        cursor.execute("DELETE FROM friendships WHERE conversation_id = %s", (conversation_id,))
 
-    # Close db connection once complete
-    conn.close()
+        # Remove unread counters
+        cursor.execute("DELETE FROM unread_counters WHERE conversation_id = %s", (conversation_id,))
+        conn.commit()
 
-async def fetch_last_messages(conversation_ids: list) -> list:
+@run_in_executor
+def fetch_last_messages(conversation_ids: list) -> list:
     """
     ## Fetch Last Messages
     Fetches the most recent message for each conversation id.
@@ -87,25 +166,31 @@ async def fetch_last_messages(conversation_ids: list) -> list:
     ### Returns
     list: list of messages.
     """
+    if not conversation_ids:
+        return []
+
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # Read every last message pointer in one indexed lookup
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+        cursor.execute(f"""
+            SELECT conversation_id, last_message_author, last_message_preview
+            FROM conversations
+            WHERE conversation_id IN ({placeholders})""",
+        list(conversation_ids))
+        last_messages = {row[0]: row for row in cursor.fetchall()}
 
     messages = []
 
     for conversation in conversation_ids:
-        cursor.execute("""
-            SELECT author, content FROM messages 
-            WHERE conversation_id = %s 
-            ORDER BY id 
-            DESC LIMIT 1""", 
-        (conversation,))
-        message = cursor.fetchone()
-
-        if message:
-            messages.append({"id": conversation, "message": f"{message[0]} - {message[1]}"})
+        message = last_messages.get(conversation)
+
+        if message and message[1] is not None:
+            messages.append({"id": conversation, "message": f"{message[1]} - {message[2]}"})
         else:
             messages.append({"id": conversation, "message": "This is a new conversation!"})
 
-    conn.close()
-    return messages
\ No newline at end of file
+    return messages
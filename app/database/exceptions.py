@@ -12,4 +12,8 @@ class NotFound(Exception):
     pass
 
 class NoPermission(Exception):
-    pass
\ No newline at end of file
+    pass
+
+class MigrationLockTimeout(Exception):
+    """Error for when another worker held the schema migration lock for too long."""
+    pass
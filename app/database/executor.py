@@ -0,0 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+from app.config import get_config
+import contextvars
+import functools
+import threading
+import asyncio
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Get the dedicated database executor, creating it on first use.
+    The number of worker threads caps how many queries run at the same time.
+    Returns:
+        ThreadPoolExecutor: The database executor.
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_config('mysql-max-concurrency'),
+                    thread_name_prefix="database"
+                )
+
+    return _executor
+
+def shutdown_executor() -> None:
+    """
+    Shut down the database executor if it was created.
+    Returns:
+        None
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
+
+async def run(func, *args, **kwargs):
+    """
+    Run a blocking database call on the database executor.
+    Args:
+        func (callable): The blocking function to run.
+        *args: Positional arguments for the function.
+        **kwargs: Keyword arguments for the function.
+    Returns:
+        any: The return value of the function.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Copy the context so things like Sentry spans follow the query into the worker thread
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+
+    return await loop.run_in_executor(get_executor(), call)
+
+def run_in_executor(func):
+    """
+    Decorator that turns a blocking database function into a coroutine function
+    that runs on the database executor instead of the event loop.
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run(func, *args, **kwargs)
+
+    return wrapper
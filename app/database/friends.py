@@ -1,4 +1,6 @@
 from app.database.connections import get_connection
+from app.database.executor import run_in_executor
+from app.database import conversations
 import json
 import uuid
 import datetime
@@ -7,51 +9,68 @@ from typing import Optional, List, cast
 import app.responses as responses
 from mysql.connector.cursor import MySQLCursorDict
 
-async def get_friends_list(account: str) -> list:
+@run_in_executor
+def get_friends_list(account: str, include_unread: bool = True) -> list:
     """
     Gets all friends of a user.
     Args:
         account (str): The account identifier of the user.
+        include_unread (bool): Whether to count unread messages for each friend.
+            Skip it when only the usernames are needed.
     Raises:
         None
     Returns:
         friends_list (list): A list of friends.
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    friends_list = None
-
-    # Gets all data from the database
-    cursor.execute("SELECT * FROM users WHERE account = %s", (account,))
-    item = cursor.fetchone()
-
-    # Check if friends list is present
-    # If not, then it will be created
-    if not item:
-        cursor.execute("INSERT INTO users (account, friend_requests, friends) VALUES (%s, %s, %s)", (account, "[]", "[]"))
-        conn.commit()
-
-        return []
-
-    # Get friends list from the data
-    friends_list = json.loads(item[3])
-
-    # Go through each conversation and get number of unread messages
-    for friend in friends_list:
-        cursor.execute("SELECT COUNT(*) FROM messages WHERE conversation_id = %s AND (viewed = 0 OR viewed IS NULL) AND author != %s", (friend["Id"], account))
-        unread_messages = cursor.fetchone()
-
-        # Add unread messages to friend
-        friend["Unread_Messages"] = unread_messages[0]
-
-    # Close db connection once complete
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # Get friends in the order they were added
+        # Unread messages for every conversation are read from their counters in the same query
+        if include_unread:
+            cursor.execute("""
+                SELECT friendships.friend, friendships.conversation_id, COALESCE(unread_counters.unread_count, 0)
+                FROM friendships
+                LEFT JOIN unread_counters
+                    ON unread_counters.account = friendships.account
+                    AND unread_counters.conversation_id = friendships.conversation_id
+                WHERE friendships.account = %s
+                ORDER BY friendships.id
+            """, (account,))
+        else:
+            cursor.execute("""
+                SELECT friend, conversation_id FROM friendships
+                WHERE account = %s
+                ORDER BY id
+            """, (account,))
+        friendships = cursor.fetchall()
+
+        # Check if user account is present
+        # If not, then it will be created
+        if not friendships:
+            cursor.execute("SELECT account FROM users WHERE account = %s", (account,))
+
+            if not cursor.fetchone():
+                cursor.execute("INSERT INTO users (account, friend_requests, friends) VALUES (%s, %s, %s)", (account, "[]", "[]"))
+                conn.commit()
+
+            return []
+
+    friends_list = []
+
+    for friendship in friendships:
+        friend = {"Username": friendship[0], "Id": friendship[1]}
+
+        if include_unread:
+            friend["Unread_Messages"] = friendship[2]
+
+        friends_list.append(friend)
 
     return friends_list
 
-async def get_friend_requests(account: str) -> List[responses.FriendRequestResponse]:
+@run_in_executor
+def get_friend_requests(account: str) -> List[responses.FriendRequestResponse]:
     """
     Get all friend requests for a user.
     Args:
@@ -62,48 +81,43 @@ async def get_friend_requests(account: str) -> List[responses.FriendRequestRespo
         None
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = cast(MySQLCursorDict, conn.cursor(dictionary=True))
-
-    # Gets all data from the database
-    cursor.execute("SELECT * FROM users WHERE account = %s", (account,))
-    item = cursor.fetchone()
-
-    # Check if friend requests list is present
-    # If not, then it will be created
-    if not item:
-        cursor.execute("INSERT INTO users (account, friend_requests, friends) VALUES (%s, %s, %s)", (account, "[]", "[]"))
-        conn.commit()
-
-        # Close db connection once complete
-        conn.close()
-
-        return []
-    else:
-        # Get all friend requests from the database
-        cursor.execute("SELECT * FROM friend_requests WHERE recipient = %s", (account,))
-        data = cursor.fetchall()
-
-        friend_requests: List[responses.FriendRequestResponse] = []
-
-        # Format friend requests
-        for request in data:
-            if not request: continue
-
-            friend_requests.append(responses.FriendRequestResponse(
-                Sender=cast(str, request['sender']),
-                Recipient=cast(str, request['recipient']),
-                Request_Id=cast(str, request['request_id']),
-                Create_Time=cast(datetime.datetime, request['create_time']),
-                Message=cast(Optional[str], request['message'])
-            ))
-
-        # Close db connection once complete
-        conn.close()
-
-        return friend_requests
-
-async def add_new_friend(sender: str, recipient: str, message: Optional[str] = None) -> str:
+    with get_connection() as conn:
+        cursor = cast(MySQLCursorDict, conn.cursor(dictionary=True))
+
+        # Gets all data from the database
+        cursor.execute("SELECT * FROM users WHERE account = %s", (account,))
+        item = cursor.fetchone()
+
+        # Check if friend requests list is present
+        # If not, then it will be created
+        if not item:
+            cursor.execute("INSERT INTO users (account, friend_requests, friends) VALUES (%s, %s, %s)", (account, "[]", "[]"))
+            conn.commit()
+
+            return []
+        else:
+            # Get all friend requests from the database
+            cursor.execute("SELECT * FROM friend_requests WHERE recipient = %s", (account,))
+            data = cursor.fetchall()
+
+            friend_requests: List[responses.FriendRequestResponse] = []
+
+            # Format friend requests
+            for request in data:
+                if not request: continue
+
+                friend_requests.append(responses.FriendRequestResponse(
+                    Sender=cast(str, request['sender']),
+                    Recipient=cast(str, request['recipient']),
+                    Request_Id=cast(str, request['request_id']),
+                    Create_Time=cast(datetime.datetime, request['create_time']),
+                    Message=cast(Optional[str], request['message'])
+                ))
+
+            return friend_requests
+
+@run_in_executor
+def add_new_friend(sender: str, recipient: str, message: Optional[str] = None) -> str:
     """
     Adds a new friend request from the sender to the recipient.
     Args:
@@ -116,42 +130,39 @@ async def add_new_friend(sender: str, recipient: str, message: Optional[str] = N
         request_id (str): The id of the newly created request.
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Gets all data from the database
-    cursor.execute("SELECT * FROM users WHERE account = %s", (recipient,))
-    database_account = cursor.fetchone()
+        # Gets all data from the database
+        cursor.execute("SELECT * FROM users WHERE account = %s", (recipient,))
+        database_account = cursor.fetchone()
 
-    # Check if account exists
-    if not database_account:
-        raise exceptions.AccountNotFound()
+        # Check if account exists
+        if not database_account:
+            raise exceptions.AccountNotFound()
 
-    # Check if a request is already outgoing to this user
-    cursor.execute("SELECT * FROM friend_requests WHERE sender = %s AND recipient = %s",
-                   (sender, recipient,))
-    request = cursor.fetchone()
+        # Check if a request is already outgoing to this user
+        cursor.execute("SELECT * FROM friend_requests WHERE sender = %s AND recipient = %s",
+                       (sender, recipient,))
+        request = cursor.fetchone()
 
-    if request:
-        raise exceptions.RequestAlreadyOutgoing()
+        if request:
+            raise exceptions.RequestAlreadyOutgoing()
     
-    # Generate request info
-    request_id = str(uuid.uuid4())
-    request_date = datetime.datetime.now(datetime.timezone.utc)
-
-    # Add request to database
-    cursor.execute("""INSERT INTO friend_requests (sender, recipient, create_time, request_id, message)
-                VALUES (%s, %s, %s, %s, %s)""", (sender, recipient, request_date, request_id, message))
-    conn.commit()
+        # Generate request info
+        request_id = str(uuid.uuid4())
+        request_date = datetime.datetime.now(datetime.timezone.utc)
 
-    # Close db connection once complete
-    conn.close()
+        # Add request to database
+        cursor.execute("""INSERT INTO friend_requests (sender, recipient, create_time, request_id, message)
+                    VALUES (%s, %s, %s, %s, %s)""", (sender, recipient, request_date, request_id, message))
+        conn.commit()
 
     return request_id
 
 async def accept_friend(request_id: str, account: str) -> str:
     """
-    Accepts a friend request from a user.
+    Accepts a friend request from a user and caches the members of the new conversation.
     Args:
         request_id (str): The identifier for the request.
         account (str): The account accepting the request.
@@ -162,68 +173,72 @@ async def accept_friend(request_id: str, account: str) -> str:
         conversation_id (str): The id of the newly created conversation.
         sender (str): The user who sent the request.
     """
-    # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Fetch request from database
-    cursor.execute("SELECT * FROM friend_requests WHERE request_id = %s", (request_id,))
-    request = cursor.fetchone()
+    conversation_id, sender = await _accept_friend(request_id, account)
 
-    # Check if request exists
-    if not request:
-        raise exceptions.NotFound()
-    
-    # Check if user has permission to accept this request
-    if request[2] != account:
-        raise exceptions.NoPermission()
-    
-    # Generate a conversation id
-    conversation_id = str(uuid.uuid4())
+    # Members are known already, so the first message doesn't need to look them up
+    conversations.get_members_cache().invalidate(conversation_id)
+    conversations.get_members_cache().set(conversation_id, (sender, account))
 
-    # Get sender account friends
-    cursor.execute("SELECT friends FROM users WHERE account = %s", (request[1],))
-    sender_account = cursor.fetchone()
+    return conversation_id, sender
 
-    # Load sender friends
-    sender_friends = json.loads(sender_account[0])
+@run_in_executor
+def _accept_friend(request_id: str, account: str) -> str:
+    """
+    Accepts a friend request from a user.
+    Args:
+        request_id (str): The identifier for the request.
+        account (str): The account accepting the request.
+    Raises:
+        NotFound: If the request does not exist.
+        NoPermission: If the user does not have permission to accept the request.
+    Returns:
+        conversation_id (str): The id of the newly created conversation.
+        sender (str): The user who sent the request.
+    """
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Add friend to user friends
-    sender_friends.append({"Username": request[2], "Id": conversation_id})
+        # Fetch request from database
+        cursor.execute("SELECT * FROM friend_requests WHERE request_id = %s", (request_id,))
+        request = cursor.fetchone()
 
-    # Update friends in database
-    cursor.execute("UPDATE users SET friends = %s WHERE account = %s",
-                (json.dumps(sender_friends), request[1]))
+        # Check if request exists
+        if not request:
+            raise exceptions.NotFound()
     
-    # Get recipient friends
-    cursor.execute("SELECT friends FROM users WHERE account = %s", (request[2],))
-    recipient_account = cursor.fetchone()
-
-    # Load recipient friends
-    recipient_friends = json.loads(recipient_account[0])
-
-    # Add friend to user friends
-    recipient_friends.append({"Username": request[1], "Id": conversation_id})
-
-    # Update friends in database
-    cursor.execute("UPDATE users SET friends = %s WHERE account = %s",
-                (json.dumps(recipient_friends), request[2]))
+        # Check if user has permission to accept this request
+        if request[2] != account:
+            raise exceptions.NoPermission()
     
-    # Create conversation
-    cursor.execute("INSERT INTO conversations (conversation_id, members) VALUES (%s, %s)",
-                (conversation_id, json.dumps([request[1], request[2]])))
+        # Generate a conversation id
+        conversation_id = str(uuid.uuid4())
+
+        # Add each user to the other's friends
+        cursor.execute("""
+            INSERT INTO friendships (account, friend, conversation_id)
+            VALUES (%s, %s, %s), (%s, %s, %s)
+        """, (request[1], request[2], conversation_id, request[2], request[1], conversation_id))
     
-    # Remove request from database
-    cursor.execute("DELETE FROM friend_requests WHERE request_id = %s", (request_id,))
+        # Create conversation
+        cursor.execute("INSERT INTO conversations (conversation_id, members) VALUES (%s, %s)",
+                    (conversation_id, json.dumps([request[1], request[2]])))
+
+        # Add conversation members
+        cursor.execute("""
+            INSERT INTO conversation_members (conversation_id, account)
+            VALUES (%s, %s), (%s, %s)
+        """, (conversation_id, request[1], conversation_id, request[2]))
     
-    conn.commit()
-
-    # Close db connection once complete
-    conn.close()
+        # Remove request from database
+        cursor.execute("DELETE FROM friend_requests WHERE request_id = %s", (request_id,))
+    
+        conn.commit()
 
     return conversation_id, request[1]
 
-async def deny_friend(request_id: str, account: str) -> None:
+@run_in_executor
+def deny_friend(request_id: str, account: str) -> None:
     """
     Denies a friend request from a user.
     Args:
@@ -236,29 +251,27 @@ async def deny_friend(request_id: str, account: str) -> None:
         None
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Get request from database
-    cursor.execute("SELECT * from friend_requests WHERE request_id = %s", (request_id,))
-    request = cursor.fetchone()
+        # Get request from database
+        cursor.execute("SELECT * from friend_requests WHERE request_id = %s", (request_id,))
+        request = cursor.fetchone()
 
-    # Check if request exists
-    if not request:
-        raise exceptions.NotFound()
+        # Check if request exists
+        if not request:
+            raise exceptions.NotFound()
     
-    # Check if user has permission to deny the request
-    if request[2] != account:
-        raise exceptions.NoPermission()
+        # Check if user has permission to deny the request
+        if request[2] != account:
+            raise exceptions.NoPermission()
     
-    # Remove request from database
-    cursor.execute("DELETE FROM friend_requests WHERE request_id = %s", (request_id,))
-    conn.commit()
-
-    # Close db connection once complete
-    conn.close()
+        # Remove request from database
+        cursor.execute("DELETE FROM friend_requests WHERE request_id = %s", (request_id,))
+        conn.commit()
 
-async def get_outgoing_friend_requests(account: str) -> list:
+@run_in_executor
+def get_outgoing_friend_requests(account: str) -> list:
     """
     Get all outgoing friend requests for a user.
     Args:
@@ -269,77 +282,44 @@ async def get_outgoing_friend_requests(account: str) -> list:
         None
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Get all friend requests from the database
-    cursor.execute("SELECT * FROM friend_requests WHERE sender = %s", (account,))
-    data = cursor.fetchall()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    friend_requests = []
+        # Get all friend requests from the database
+        cursor.execute("SELECT * FROM friend_requests WHERE sender = %s", (account,))
+        data = cursor.fetchall()
 
-    # Format friend requests
-    for request in data:
-        friend_requests.append({
-            "Sender": request[1],
-            "Recipient": request[2],
-            "Request_Id": request[4],
-            "Create_Time": request[3]
-        })
+        friend_requests = []
 
-    # Close db connection once complete
-    conn.close()
+        # Format friend requests
+        for request in data:
+            friend_requests.append({
+                "Sender": request[1],
+                "Recipient": request[2],
+                "Request_Id": request[4],
+                "Create_Time": request[3]
+            })
 
     return friend_requests
 
+@run_in_executor
 def get_unread_message_count(user: str) -> int:
     """
     Get the number of unread messages a user has for all their conversations.
     Args:
         member (str): The member accessing the unread messages.
     Raises:
-        database.exceptions.NotFound: User was not found.
+        None
     Returns:
         messageCount (int): The number of unread messages.
     """
-    conn = get_connection()
-    cursor = conn.cursor(dictionary=True)
-
-    # Get the users friends list
-    cursor.execute(
-        "SELECT friends FROM users WHERE account = %s",
-        (user,)
-    )
-    friendsListRAW = cursor.fetchone()['friends']
-
-    if friendsListRAW:
-        friendsList = json.loads(friendsListRAW)
-    else:
-        raise exceptions.NotFound()
-    
-    # Return 0 if the user has no friends :(
-    if len(friendsList) == 0:
-        return 0
-    
-    # Create a list of conversation ids from the friends list
-    # and SQL placeholders for each
-    conversations = []
-
-    for friend in friendsList:
-        conversations.append(friend['Id'])
-
-    placeholders = ', '.join(['%s'] * len(conversations))
-
-    # Get number of unread messages from the database
-    params = conversations + [user] 
-    cursor.execute(
-        f"""SELECT COUNT(*) FROM messages
-        WHERE conversation_id IN ({placeholders}) AND
-        (viewed = 0 OR viewed IS NULL) AND
-        author != %s""",
-        params
-    )
-    messageCount = cursor.fetchone()
-
-    conn.close()
-    return messageCount['COUNT(*)']
\ No newline at end of file
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # Add up the unread counters of every conversation the user is in
+        cursor.execute(
+            "SELECT COALESCE(SUM(unread_count), 0) FROM unread_counters WHERE account = %s",
+            (user,)
+        )
+        messageCount = cursor.fetchone()
+    return int(messageCount[0])
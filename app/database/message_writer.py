@@ -0,0 +1,181 @@
+from app.database import messages
+import app.database.exceptions as exceptions
+import app.config as config
+import asyncio
+
+# Messages waiting to be written as (enqueue time, row, future)
+_pending = []
+
+# Set while messages are waiting, and once a full batch is waiting
+_waiting = asyncio.Event()
+_full = asyncio.Event()
+
+_task = None
+
+# Batch currently being written
+_writing = None
+
+# Write pipeline metrics
+metrics = {
+    "messages": 0,
+    "batches": 0,
+    "failures": 0,
+    "max_batch": 0,
+}
+
+async def _write(batch: list) -> None:
+    rows = [row for _, row, _ in batch]
+
+    try:
+        message_ids = await messages.insert_messages(rows)
+    except Exception as e:
+        metrics['failures'] += 1
+
+        # The batch was rolled back, so write its messages one at a time
+        # and only fail the senders whose message can't be written
+        if len(batch) > 1:
+            for entry in batch:
+                await _write([entry])
+            return
+
+        for _, _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        return
+
+    metrics['messages'] += len(batch)
+    metrics['batches'] += 1
+    metrics['max_batch'] = max(metrics['max_batch'], len(batch))
+
+    for (_, _, future), message_id in zip(batch, message_ids):
+        # Sender stopped waiting, the message is still written
+        if future.done():
+            continue
+
+        if message_id is None:
+            future.set_exception(exceptions.ConversationNotFound())
+        else:
+            future.set_result(message_id)
+
+def _take_batch() -> list:
+    batch_size = config.get_config('message-batch-size')
+
+    batch = _pending[:batch_size]
+    del _pending[:batch_size]
+
+    if not _pending:
+        _waiting.clear()
+
+    if len(_pending) < batch_size:
+        _full.clear()
+
+    return batch
+
+async def _run() -> None:
+    global _writing
+
+    loop = asyncio.get_running_loop()
+
+    while True:
+        await _waiting.wait()
+
+        # Give concurrent senders until the oldest message's deadline to join the batch
+        if not _full.is_set():
+            timeout = _pending[0][0] + config.get_config('message-batch-max-latency') - loop.time()
+
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(_full.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+        # Only one batch is written at a time, so the next one fills up while this one commits
+        # Shielded so stopping the pipeline doesn't abandon a batch halfway through
+        _writing = asyncio.ensure_future(_write(_take_batch()))
+        await asyncio.shield(_writing)
+
+async def send_message(
+    author: str,
+    conversation_id: str,
+    message: str,
+    self_destruct,
+    message_type: str = None,
+    gif_url: str = None
+) -> str:
+    """
+    Queue a message to be written with other messages sent at the same time.
+    Waits until the batch it was written in is committed.
+    Args:
+        author (str): The account sending the message.
+        conversation_id (str): The conversation to send the message to.
+        message (str): The message content.
+        self_destruct: Minutes until the message is deleted after being viewed, or "False".
+        message_type (str): The message type, such as "GIF".
+        gif_url (str): The GIF url for GIF messages.
+    Raises:
+        ConversationNotFound: If the conversation does not exist.
+    Returns:
+        str: The new message id.
+    """
+    loop = asyncio.get_running_loop()
+
+    # Fall back to starting the pipeline here if the lifespan did not run
+    start()
+
+    future = loop.create_future()
+    _pending.append((loop.time(), (author, conversation_id, message, self_destruct, message_type, gif_url), future))
+
+    _waiting.set()
+
+    if len(_pending) >= config.get_config('message-batch-size'):
+        _full.set()
+
+    return await future
+
+def start() -> None:
+    """
+    Start the message write pipeline.
+    Called from the app lifespan on startup.
+    Returns:
+        None
+    """
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+
+async def stop() -> None:
+    """
+    Stop the message write pipeline after writing any messages still waiting.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+        _task = None
+
+    if _writing is not None:
+        await _writing
+
+    while _pending:
+        await _write(_take_batch())
+
+def get_stats() -> dict:
+    """
+    Get message write pipeline metrics.
+    Returns:
+        dict: The pipeline metrics.
+    """
+    return {
+        "pending": len(_pending),
+        **metrics,
+    }
@@ -1,43 +1,248 @@
 from app.database.connections import get_connection
+from app.database.executor import run_in_executor
 import uuid
 import app.database.exceptions as exceptions
+from typing import Optional
 
-async def send_message(
-    author,
-    conversation_id,
-    message,
-    self_destruct,
-    message_type = None,
-    gif_url = None
-):
-    # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    # Get conversation
-    cursor.execute("SELECT * FROM conversations WHERE conversation_id = %s", (conversation_id,))
-    conversation = cursor.fetchone()
+# Maximum length of the last message preview kept on each conversation
+PREVIEW_LENGTH = 255
 
-    # Check if conversation exists
-    if not conversation:
-        conn.close()
-        raise exceptions.ConversationNotFound()
+def refresh_last_messages(cursor, conversation_ids: list) -> None:
+    """
+    Recalculate the last message pointer of conversations from their messages.
+    Used when the last message of a conversation may have been deleted.
+    Conversations with no messages left have every pointer column cleared.
+    The caller is responsible for committing.
+    Args:
+        cursor: Cursor on the connection to run the update with.
+        conversation_ids (list): The conversations to recalculate.
+    Returns:
+        None
+    """
+    if not conversation_ids:
+        return
+
+    placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+    cursor.execute(f"""
+        UPDATE conversations
+        LEFT JOIN (
+            SELECT messages.id, messages.conversation_id, messages.message_id, messages.author, messages.content
+            FROM messages
+            JOIN (
+                SELECT conversation_id, MAX(id) AS id FROM messages
+                WHERE conversation_id IN ({placeholders})
+                GROUP BY conversation_id
+            ) AS latest ON latest.id = messages.id
+        ) AS last_message ON last_message.conversation_id = conversations.conversation_id
+        SET conversations.last_message_id = last_message.message_id,
+            conversations.last_message_internal_id = last_message.id,
+            conversations.last_message_author = last_message.author,
+            conversations.last_message_preview = LEFT(last_message.content, %s)
+        WHERE conversations.conversation_id IN ({placeholders})
+    """, list(conversation_ids) + [PREVIEW_LENGTH] + list(conversation_ids))
+
+def get_unread_count(cursor, account: str, conversation_id: str) -> int:
+    """
+    Read the unread message counter of an account for one conversation.
+    Args:
+        cursor: Cursor on the connection to read with.
+        account (str): The account the messages are unread for.
+        conversation_id (str): The identifier for the conversation.
+    Returns:
+        int: Number of unread messages.
+    """
+    cursor.execute("""
+        SELECT unread_count FROM unread_counters
+        WHERE account = %s AND conversation_id = %s
+    """, (account, conversation_id))
+    counter = cursor.fetchone()
 
-    # Generate random message id
-    message_id = str(uuid.uuid4())
+    return counter[0] if counter else 0
 
-    # Insert message into database
+def get_read_watermarks(cursor, conversation_id: str) -> dict:
+    """
+    Read the last read message id of every member of a conversation.
+    Args:
+        cursor: Cursor on the connection to read with.
+        conversation_id (str): The identifier for the conversation.
+    Returns:
+        dict: Internal id of the last message each account has read, by account.
+    """
     cursor.execute("""
-        INSERT INTO messages (author, content, message_id, conversation_id, self_destruct, message_type, GIF_URL) 
-        VALUES (%s, %s, %s, %s, %s, %s, %s)""", 
-        (author, message, message_id, conversation_id, self_destruct, message_type, gif_url)
+        SELECT account, last_read_id FROM unread_counters
+        WHERE conversation_id = %s
+    """, (conversation_id,))
+
+    return {account: last_read_id for account, last_read_id in cursor.fetchall()}
+
+def _is_viewed(message: tuple, watermarks: dict) -> bool:
+    # A message is viewed once any other member has read past it
+    return any(
+        last_read_id >= message[0]
+        for account, last_read_id in watermarks.items()
+        if account != message[1]
     )
-    conn.commit()
-    conn.close()
 
-    return message_id
-        
-async def get_messages(conversation_id: str, offset: int, account: str) -> tuple[list, str]:
+def advance_read_watermark(cursor, account: str, conversation_id: str, message_id: int) -> bool:
+    """
+    Mark every message in a conversation up to an internal id as read by an account.
+    Starts the self-destruct timers of the messages that were newly read and
+    recounts the account's unread messages. The caller is responsible for committing.
+    Args:
+        cursor: Cursor on the connection to run the update with.
+        account (str): The account reading the messages.
+        conversation_id (str): The identifier for the conversation.
+        message_id (int): Internal id of the last message read.
+    Returns:
+        bool: False if the account had already read that far.
+    """
+    # Lock the watermark so concurrent reads don't start timers twice
+    cursor.execute("""
+        SELECT last_read_id FROM unread_counters
+        WHERE account = %s AND conversation_id = %s
+        FOR UPDATE
+    """, (account, conversation_id))
+    watermark = cursor.fetchone()
+    last_read_id = watermark[0] if watermark else 0
+
+    if message_id <= last_read_id:
+        return False
+
+    # Start self-destruct timers for messages read for the first time
+    cursor.execute("""
+        UPDATE messages
+        SET delete_time = DATE_ADD(UTC_TIMESTAMP(), INTERVAL self_destruct MINUTE)
+        WHERE conversation_id = %s
+        AND id > %s AND id <= %s
+        AND author != %s
+        AND self_destruct IS NOT NULL
+        AND self_destruct != 'False'
+        AND delete_time IS NULL
+    """, (conversation_id, last_read_id, message_id, account))
+
+    # Move the watermark and count whatever is still unread after it
+    cursor.execute("""
+        INSERT INTO unread_counters (account, conversation_id, last_read_id, unread_count)
+        SELECT %s, %s, %s, COUNT(*) FROM messages
+        WHERE conversation_id = %s AND id > %s AND author != %s
+        ON DUPLICATE KEY UPDATE
+            last_read_id = VALUES(last_read_id),
+            unread_count = VALUES(unread_count)
+    """, (account, conversation_id, message_id, conversation_id, message_id, account))
+
+    return True
+
+@run_in_executor
+def insert_messages(rows: list) -> list:
+    """
+    Insert a batch of messages under a single commit.
+    Args:
+        rows (list): (author, conversation_id, message, self_destruct, message_type, gif_url) for each message.
+    Returns:
+        list: The new message id for each row, in order, or None if its conversation does not exist.
+    """
+    if not rows:
+        return []
+
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # Check which conversations exist
+        conversation_ids = list({row[1] for row in rows})
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+        cursor.execute(
+            f"SELECT conversation_id FROM conversations WHERE conversation_id IN ({placeholders})",
+            conversation_ids
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+
+        message_ids = []
+        values = []
+
+        # Last message and number of messages from each author, by conversation
+        last_messages = {}
+        sent = {}
+
+        for author, conversation_id, message, self_destruct, message_type, gif_url in rows:
+            if conversation_id not in existing:
+                message_ids.append(None)
+                continue
+
+            # Generate random message id
+            message_id = str(uuid.uuid4())
+            message_ids.append(message_id)
+
+            values.append((author, message, message_id, conversation_id, self_destruct, message_type, gif_url))
+            last_messages[conversation_id] = (message_id, author, (message or "")[:PREVIEW_LENGTH])
+            sent[(conversation_id, author)] = sent.get((conversation_id, author), 0) + 1
+
+        if values:
+            # Insert every message in one statement, keeping their order
+            cursor.execute(
+                "INSERT INTO messages (author, content, message_id, conversation_id, self_destruct, message_type, GIF_URL) VALUES "
+                + ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(values)),
+                [value for row in values for value in row]
+            )
+
+            # Look up the internal ids of the new last messages
+            placeholders = ', '.join(['%s'] * len(last_messages))
+
+            cursor.execute(
+                f"SELECT message_id, id FROM messages WHERE message_id IN ({placeholders})",
+                [last_message[0] for last_message in last_messages.values()]
+            )
+            internal_ids = dict(cursor.fetchall())
+
+            # Point each conversation at its new last message in the same transaction
+            # Another batch may have committed a newer message first, so never move the pointer backwards
+            cursor.executemany("""
+                UPDATE conversations
+                SET last_message_id = %s, last_message_internal_id = %s, last_message_author = %s, last_message_preview = %s
+                WHERE conversation_id = %s
+                AND (last_message_internal_id IS NULL OR last_message_internal_id < %s)""",
+                [
+                    (message_id, internal_ids[message_id], author, preview, conversation_id, internal_ids[message_id])
+                    for conversation_id, (message_id, author, preview) in last_messages.items()
+                ]
+            )
+
+            # Count the messages as unread for every other member
+            for (conversation_id, author), count in sent.items():
+                cursor.execute("""
+                    INSERT INTO unread_counters (account, conversation_id, unread_count)
+                    SELECT account, conversation_id, %s FROM conversation_members
+                    WHERE conversation_id = %s AND account != %s
+                    ON DUPLICATE KEY UPDATE unread_count = unread_counters.unread_count + VALUES(unread_count)""",
+                    (count, conversation_id, author)
+                )
+
+            conn.commit()
+
+    return message_ids
+
+def _format_message(message: tuple, watermarks: dict) -> dict:
+    # Format self destruct for messages
+    if bool(message[5]) is not False:
+        self_destruct = message[5]
+    else:
+        self_destruct = False
+
+    return {
+        "Author": message[1],
+        "Message": message[2],
+        "Message_Id": message[3],
+        "Self_Destruct": self_destruct,
+        "Message_Type": message[8],
+        "GIF_URL": message[9],
+        "Send_Time": message[10],
+        "Viewed": _is_viewed(message, watermarks)
+    }
+
+@run_in_executor
+def get_messages(conversation_id: str, offset: int, account: str) -> tuple[list, str]:
     """
     Gets messages from a conversation.
     Args:
@@ -51,169 +256,254 @@ async def get_messages(conversation_id: str, offset: int, account: str) -> tuple
         unread_messages (int): Number of unread messages.
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Get conversation
-    cursor.execute("SELECT * FROM conversations WHERE conversation_id = %s", (conversation_id,))
-    conversation = cursor.fetchone()
+        # Get conversation
+        cursor.execute("SELECT * FROM conversations WHERE conversation_id = %s", (conversation_id,))
+        conversation = cursor.fetchone()
 
-    # Used for formatting messages
-    messages = []
+        # Used for formatting messages
+        messages = []
 
-    # Check if conversation exists
-    if not conversation:
-        conn.close()
-        raise exceptions.ConversationNotFound()
+        # Check if conversation exists
+        if not conversation:
+            raise exceptions.ConversationNotFound()
 
-    # Get all messages
-    cursor.execute("""
-        SELECT * FROM messages
-        WHERE conversation_id = %s
-        ORDER BY id DESC
-        LIMIT 20 OFFSET %s
-    """, (conversation_id, offset))
-    database_messages = cursor.fetchall()
-
-    # Format messages
-    for message in database_messages:
-        # Format self destruct for messages
-        if bool(message[5]) is not False:
-            self_destruct = message[5]
+        # Get all messages
+        cursor.execute("""
+            SELECT * FROM messages
+            WHERE conversation_id = %s
+            ORDER BY id DESC
+            LIMIT 20 OFFSET %s
+        """, (conversation_id, offset))
+        database_messages = cursor.fetchall()
+
+        # Format messages
+        watermarks = get_read_watermarks(cursor, conversation_id)
+
+        for message in database_messages:
+            messages.append(_format_message(message, watermarks))
+
+        # Get number of unread messages
+        unread_messages = get_unread_count(cursor, account, conversation_id)
+
+    return messages, unread_messages
+
+@run_in_executor
+def get_messages_page(
+    conversation_id: str,
+    account: str,
+    before_id: Optional[int] = None,
+    limit: int = 20
+) -> tuple[list, int, Optional[tuple[int, int]], bool]:
+    """
+    Gets a page of messages from a conversation using keyset pagination.
+    Seeks directly to the page with the (conversation_id, id) index, so loading
+    deep history costs the same as loading the newest messages.
+    Args:
+        conversation_id (str): The identifier for the conversation.
+        account (str): The account requesting the messages.
+        before_id (int): Only return messages older than this internal id (None for the newest page).
+        limit (int): The maximum number of messages to return.
+    Raises:
+        ConversationNotFound: Conversation not found.
+    Returns:
+        messages (list): List of messages, newest first.
+        unread_messages (int): Number of unread messages.
+        id_range (tuple[int, int]): Internal ids of the oldest and newest message in the page, or None if the page is empty.
+        has_more (bool): Whether there are older messages. Pass the oldest id as before_id to load them.
+    """
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        # Get conversation
+        cursor.execute("SELECT conversation_id FROM conversations WHERE conversation_id = %s", (conversation_id,))
+        conversation = cursor.fetchone()
+
+        # Check if conversation exists
+        if not conversation:
+            raise exceptions.ConversationNotFound()
+
+        # Fetch one extra row to know if there is another page
+        if before_id is None:
+            cursor.execute("""
+                SELECT * FROM messages
+                WHERE conversation_id = %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (conversation_id, limit + 1))
         else:
-            self_destruct = False
-
-        messages.append({
-            "Author": message[1],
-            "Message": message[2],
-            "Message_Id": message[3],
-            "Self_Destruct": self_destruct,
-            "Message_Type": message[8],
-            "GIF_URL": message[9],
-            "Send_Time": message[10],
-            "Viewed": bool(message[6])
-        })
+            cursor.execute("""
+                SELECT * FROM messages
+                WHERE conversation_id = %s AND id < %s
+                ORDER BY id DESC
+                LIMIT %s
+            """, (conversation_id, before_id, limit + 1))
+        database_messages = cursor.fetchall()
 
-    # Get number of unread messages
-    cursor.execute(
-        "SELECT COUNT(*) FROM messages "
-        "WHERE conversation_id = %s "
-        "AND (viewed = 0 OR viewed IS NULL) "
-        "AND author != %s", 
-        (conversation_id, account)
-    )
-    unread_messages = cursor.fetchone()
-    conn.close()
+        has_more = len(database_messages) > limit
+        database_messages = database_messages[:limit]
+
+        messages = []
+        watermarks = get_read_watermarks(cursor, conversation_id)
+
+        for message in database_messages:
+            messages.append(_format_message(message, watermarks))
+
+        # Get number of unread messages
+        unread_messages = get_unread_count(cursor, account, conversation_id)
 
-    return messages, unread_messages[0]
+    # Internal ids of the oldest and newest message in the page
+    id_range = None
 
-async def mark_message_viewed_bulk(user: str, conversation_id: str, offset: int) -> None:
+    if database_messages:
+        id_range = (database_messages[-1][0], database_messages[0][0])
+
+    return messages, unread_messages, id_range, has_more
+
+@run_in_executor
+def mark_messages_read(account: str, conversation_id: str, message_id: int) -> None:
     """
-    ## Mark Message Viewed Bulk
-    Mark the last 20 messages sent by a user as viewed.
+    ## Mark Messages Read
+    Mark every message in a conversation up to an internal id as read.
+    Used with keyset pages, so the newest id in the page is all that's needed.
 
     ### Parameters
-    - user: The user that sent the messages.
+    - account: The user reading the messages.
     - conversation_id: The conversation thats being viewed.
-    - offset: The offset in the database
+    - message_id: Internal id of the newest message read.
 
     ### Returns
     None
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Mark messages as viewed
-    cursor.execute("""
-    UPDATE messages 
-    SET viewed = 1 
-    WHERE id IN (
-        SELECT id 
-        FROM (
-            SELECT id 
-            FROM messages 
-            WHERE conversation_id = %s 
-            ORDER BY id DESC 
-            LIMIT 20 OFFSET %s
-        ) AS recent_entries
-    ) AND author = %s;
-    """, (conversation_id, offset, user))
+        advance_read_watermark(cursor, account, conversation_id, message_id)
+        conn.commit()
 
-    # Mark messages for deletion
-    cursor.execute("""
-        UPDATE messages 
-        SET delete_time = DATE_ADD(UTC_TIMESTAMP(), INTERVAL self_destruct MINUTE) 
-        WHERE conversation_id = %s 
-        AND viewed = 1 
-        AND author = %s 
-        AND self_destruct IS NOT NULL 
-        AND self_destruct != 'False';
-    """, (conversation_id, user))
-    conn.commit()
-    conn.close()
-
-async def get_delete_messages() -> list:
+@run_in_executor
+def mark_message_viewed_bulk(account: str, conversation_id: str, offset: int) -> None:
     """
-    ## Get Delete Messages
-    Get messages that are due to be deleted.
+    ## Mark Message Viewed Bulk
+    Mark a page of 20 messages as read by a user.
 
     ### Parameters
-    None
+    - account: The user reading the messages.
+    - conversation_id: The conversation thats being viewed.
+    - offset: The offset in the database
 
     ### Returns
-    - list: list of messages that should be deleted.
+    None
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT conversation_id, message_id 
-        FROM messages 
-        WHERE delete_time <= UTC_TIMESTAMP()
-        AND self_destruct IS NOT NULL
-        AND self_destruct != 'False'
-        AND viewed = 1
-        AND viewed IS NOT NULL;
-    """)
-    messages = cursor.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    data = []
+        # Find the newest message in the page
+        cursor.execute("""
+            SELECT id FROM messages
+            WHERE conversation_id = %s
+            ORDER BY id DESC
+            LIMIT 1 OFFSET %s
+        """, (conversation_id, offset))
+        newest = cursor.fetchone()
+
+        if newest:
+            advance_read_watermark(cursor, account, conversation_id, newest[0])
+            conn.commit()
+
+@run_in_executor
+def get_due_messages(window: float, limit: int) -> list:
+    """
+    ## Get Due Messages
+    Get the messages that are due to be deleted within a window of time, soonest first.
 
-    for message in messages:
-        data.append({"conversation_id": message[0], "message_id": message[1]})
+    ### Parameters
+    - window: How far ahead to look (in seconds).
+    - limit: Maximum number of messages to return.
 
-    return data
+    ### Returns
+    - list: (seconds until due, internal id, conversation_id, message_id) for each message.
+    Seconds until due is measured by the database clock and is negative for overdue messages.
+    """
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-async def destruct_messages() -> None:
+        cursor.execute("""
+            SELECT TIMESTAMPDIFF(MICROSECOND, UTC_TIMESTAMP(6), delete_time) / 1000000,
+                id, conversation_id, message_id
+            FROM messages
+            WHERE delete_time <= DATE_ADD(UTC_TIMESTAMP(), INTERVAL %s SECOND)
+            AND self_destruct IS NOT NULL
+            AND self_destruct != 'False'
+            ORDER BY delete_time
+            LIMIT %s
+        """, (int(window), limit))
+        messages = cursor.fetchall()
+
+    return [(float(message[0]), message[1], message[2], message[3]) for message in messages]
+
+@run_in_executor
+def delete_messages(ids: list) -> list:
     """
-    ## Destruct Messages
-    Deletes all messages that are ready to be self-destructed.
+    ## Delete Messages
+    Deletes self-destructed messages by their internal id and
+    points their conversations at the message before them.
+    Messages that another worker is deleting at the same time are skipped.
 
     ### Parameters
-    None
+    - ids: Internal ids of the messages to delete.
 
     ### Returns
-    None
+    - list: Internal ids of the messages this call deleted.
     """
+    if not ids:
+        return []
+
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("""
-        DELETE FROM messages
-        WHERE delete_time <= UTC_TIMESTAMP()
-        AND self_destruct IS NOT NULL
-        AND self_destruct != 'False'
-        AND viewed = 1
-        AND viewed IS NOT NULL;
-    """)
-    conn.commit()
-    conn.close()
+        placeholders = ', '.join(['%s'] * len(ids))
 
-async def get_message(message_id: str) -> dict:
+        # Claim the messages that still exist and no other worker has claimed
+        cursor.execute(f"""
+            SELECT id FROM messages
+            WHERE id IN ({placeholders})
+            FOR UPDATE SKIP LOCKED
+        """, list(ids))
+        claimed = [row[0] for row in cursor.fetchall()]
+
+        if not claimed:
+            conn.commit()
+            return []
+
+        placeholders = ', '.join(['%s'] * len(claimed))
+
+        # Find conversations whose last message is about to be deleted
+        cursor.execute(f"""
+            SELECT DISTINCT conversations.conversation_id
+            FROM messages
+            JOIN conversations ON conversations.last_message_id = messages.message_id
+            WHERE messages.id IN ({placeholders})
+        """, claimed)
+        affected_conversations = [row[0] for row in cursor.fetchall()]
+
+        cursor.execute(f"DELETE FROM messages WHERE id IN ({placeholders})", claimed)
+
+        # Point those conversations at their new last message
+        refresh_last_messages(cursor, affected_conversations)
+        conn.commit()
+
+    return claimed
+
+@run_in_executor
+def get_message(message_id: str) -> dict:
     """
     ## Get Message
     Get a message from the database based on its id.
@@ -225,59 +515,104 @@ async def get_message(message_id: str) -> dict:
     - dict: message from the database.
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    cursor.execute("SElECT * FROM messages WHERE message_id = %s", (message_id,))
-    message = cursor.fetchone()
-    conn.close()
-
-    if message:
-        return {
-            'author': message[1],
-            'content': message[2],
-            'message_id': message[3],
-            'conversation_id': message[4],
-            'self_destruct': message[5],
-            'viewed': message[6],
-            'delete_time': message[7]
-        }
-    else:
-        return None
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("SElECT * FROM messages WHERE message_id = %s", (message_id,))
+        message = cursor.fetchone()
+
+        if message:
+            watermarks = get_read_watermarks(cursor, message[4])
+
+            return {
+                'id': message[0],
+                'author': message[1],
+                'content': message[2],
+                'message_id': message[3],
+                'conversation_id': message[4],
+                'self_destruct': message[5],
+                'viewed': _is_viewed(message, watermarks),
+                'delete_time': message[7]
+            }
+        else:
+            return None
     
-async def view_message(message_id: str) -> None:
+@run_in_executor
+def view_messages(account: str, views: dict) -> dict:
     """
-    ## View Message
-    Marks a message in a conversation as viewed.
+    ## View Messages
+    Marks a batch of messages as read, moving the watermark of each conversation once.
 
     ### Parameters
-    message_id: the id for the message.
+    account: the user viewing the messages.
+    views: message ids to mark as read, by conversation id.
 
     ### Returns
-    None
+    dict: The result for each message id. One of "OK", "NO_PERMISSION", "OWN_MESSAGE" or "NOT_FOUND".
     """
+    results = {}
+
+    if not views:
+        return results
+
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    cursor.execute("UPDATE messages SET viewed = 1 WHERE message_id = %s", (message_id,))
-    conn.commit()
+        conversation_ids = list(views)
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
 
-    # Check if messages needs to be self-destructed
-    cursor.execute("SELECT self_destruct FROM messages WHERE message_id = %s", (message_id,))
-    message = cursor.fetchone()
+        # Ensure user is a member of each conversation
+        cursor.execute(f"""
+            SELECT conversation_id FROM conversation_members
+            WHERE account = %s AND conversation_id IN ({placeholders})
+        """, [account] + conversation_ids)
+        member_of = {row[0] for row in cursor.fetchall()}
 
-    if message and message[0] != "False" and message[0]:
-        cursor.execute("""
-            UPDATE messages
-            SET delete_time = DATE_ADD(UTC_TIMESTAMP(), INTERVAL self_destruct MINUTE)
-            WHERE message_id = %s
-        """, (message_id,))
-        conn.commit()
+        message_ids = []
+
+        for conversation_id, conversation_messages in views.items():
+            for message_id in conversation_messages:
+                if conversation_id in member_of:
+                    results[message_id] = "NOT_FOUND"
+                    message_ids.append(message_id)
+                else:
+                    results[message_id] = "NO_PERMISSION"
+
+        if message_ids:
+            conversation_placeholders = ', '.join(['%s'] * len(member_of))
+            message_placeholders = ', '.join(['%s'] * len(message_ids))
+
+            cursor.execute(f"""
+                SELECT id, message_id, author, conversation_id FROM messages
+                WHERE conversation_id IN ({conversation_placeholders})
+                AND message_id IN ({message_placeholders})
+            """, list(member_of) + message_ids)
+
+            # Newest message from someone else in each conversation
+            newest = {}
+
+            for internal_id, message_id, author, conversation_id in cursor.fetchall():
+                # Ignore messages that belong to a different conversation than the view claimed
+                if message_id not in views.get(conversation_id, ()):
+                    continue
+
+                if author == account:
+                    results[message_id] = "OWN_MESSAGE"
+                    continue
+
+                results[message_id] = "OK"
+                newest[conversation_id] = max(newest.get(conversation_id, 0), internal_id)
 
-    conn.close()
+            for conversation_id, internal_id in newest.items():
+                advance_read_watermark(cursor, account, conversation_id, internal_id)
 
-async def get_messages_after(message_id: str, conversation_id: str) -> list:
+            conn.commit()
+
+    return results
+
+@run_in_executor
+def get_messages_after(message_id: str, conversation_id: str) -> list:
     """
     ## Get Messages After
     Gets all messages in a conversation after a certain message
@@ -290,22 +625,22 @@ async def get_messages_after(message_id: str, conversation_id: str) -> list:
     list: List of messages.
     """
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    query = f"""
-        SELECT * FROM messages
-        WHERE conversation_id = %s
-        AND id > (
-            SELECT id FROM messages
-            WHERE message_id = %s
-            ORDER BY id LIMIT 1
-        )
-    """
-
-    cursor.execute(query, (conversation_id, message_id))
-    results = cursor.fetchall()
-    conn.close()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        query = f"""
+            SELECT * FROM messages
+            WHERE conversation_id = %s
+            AND id > (
+                SELECT id FROM messages
+                WHERE message_id = %s
+                ORDER BY id LIMIT 1
+            )
+        """
+
+        cursor.execute(query, (conversation_id, message_id))
+        results = cursor.fetchall()
+        watermarks = get_read_watermarks(cursor, conversation_id)
 
     data = []
 
@@ -316,7 +651,7 @@ async def get_messages_after(message_id: str, conversation_id: str) -> list:
             'message_id': message[3],
             'conversation_id': message[4],
             'self_destruct': message[5],
-            'viewed': message[6],
+            'viewed': _is_viewed(message, watermarks),
             'delete_time': message[7]
         })
 
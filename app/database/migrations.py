@@ -0,0 +1,587 @@
+from app.database.connections import get_connection
+from app.database.executor import run_in_executor
+from app.database import messages
+import app.database.exceptions as exceptions
+import app.config as config
+import json
+import sys
+
+# Name of the MySQL advisory lock held while migrating
+# Stops multiple workers from applying the same migration at once
+MIGRATION_LOCK = "ringer_schema_migrations"
+
+# Seconds to wait for another worker to finish migrating before giving up
+MIGRATION_LOCK_TIMEOUT = 600
+
+def _index_exists(cursor, table: str, index: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+    """, (table, index))
+
+    return cursor.fetchone()[0] > 0
+
+def _add_messages_conversation_index(conn) -> None:
+    # Lets conversation pages seek straight to a message id instead of scanning
+    cursor = conn.cursor()
+
+    if not _index_exists(cursor, "messages", "idx_messages_conversation_id"):
+        cursor.execute("""
+            ALTER TABLE messages
+            ADD INDEX idx_messages_conversation_id (conversation_id, id),
+            ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+def _table_exists(cursor, table: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = DATABASE() AND table_name = %s
+    """, (table,))
+
+    return cursor.fetchone()[0] > 0
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+    """, (table, column))
+
+    return cursor.fetchone()[0] > 0
+
+def _backfill_friendships(conn, batch_size: int = 500) -> int:
+    """
+    Copy friends from the JSON column on users into the friendships table.
+    Works through users in small batches and ignores rows that already exist.
+    Only runs once as part of the friendships migration: removing a friend no longer
+    updates the JSON column, so copying it again would bring removed friendships back.
+    Args:
+        conn: The database connection.
+        batch_size (int): Number of users to copy per transaction.
+    Returns:
+        int: Number of friendships added.
+    """
+    cursor = conn.cursor()
+
+    added = 0
+    last_account = ""
+
+    while True:
+        cursor.execute("""
+            SELECT account, friends FROM users
+            WHERE account > %s
+            ORDER BY account
+            LIMIT %s
+        """, (last_account, batch_size))
+        users = cursor.fetchall()
+
+        if not users:
+            break
+
+        rows = []
+
+        for account, friends in users:
+            for friend in json.loads(friends or "[]"):
+                rows.append((account, friend["Username"], friend["Id"]))
+
+        if rows:
+            cursor.executemany("""
+                INSERT IGNORE INTO friendships (account, friend, conversation_id)
+                VALUES (%s, %s, %s)
+            """, rows)
+            added += cursor.rowcount
+
+        conn.commit()
+        last_account = users[-1][0]
+
+    return added
+
+def _create_friendships(conn) -> None:
+    # One row per side of a friendship, replacing the JSON list on users
+    cursor = conn.cursor()
+
+    if not _table_exists(cursor, "friendships"):
+        cursor.execute("""
+            CREATE TABLE friendships (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                account VARCHAR(255) NOT NULL,
+                friend VARCHAR(255) NOT NULL,
+                conversation_id VARCHAR(255) NOT NULL,
+                UNIQUE KEY uq_friendships_account_conversation (account, conversation_id),
+                KEY idx_friendships_conversation_id (conversation_id)
+            )
+        """)
+
+    _backfill_friendships(conn)
+
+def backfill_conversation_members(conn, batch_size: int = 500) -> int:
+    """
+    Copy members from the JSON column on conversations into the conversation_members table.
+    Works through conversations in small batches and ignores rows that already exist,
+    so it can be re-run while the server is live to pick up late writes.
+    Args:
+        conn: The database connection.
+        batch_size (int): Number of conversations to copy per transaction.
+    Returns:
+        int: Number of members added.
+    """
+    cursor = conn.cursor()
+
+    added = 0
+    last_conversation = ""
+
+    while True:
+        cursor.execute("""
+            SELECT conversation_id, members FROM conversations
+            WHERE conversation_id > %s
+            ORDER BY conversation_id
+            LIMIT %s
+        """, (last_conversation, batch_size))
+        conversations = cursor.fetchall()
+
+        if not conversations:
+            break
+
+        rows = []
+
+        # Keep members in their original order
+        for conversation_id, members in conversations:
+            for member in json.loads(members or "[]"):
+                rows.append((conversation_id, member))
+
+        if rows:
+            cursor.executemany("""
+                INSERT IGNORE INTO conversation_members (conversation_id, account)
+                VALUES (%s, %s)
+            """, rows)
+            added += cursor.rowcount
+
+        conn.commit()
+        last_conversation = conversations[-1][0]
+
+    return added
+
+def _create_conversation_members(conn) -> None:
+    # One row per member of a conversation, replacing the JSON list on conversations
+    cursor = conn.cursor()
+
+    if not _table_exists(cursor, "conversation_members"):
+        cursor.execute("""
+            CREATE TABLE conversation_members (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                conversation_id VARCHAR(255) NOT NULL,
+                account VARCHAR(255) NOT NULL,
+                UNIQUE KEY uq_conversation_members_conversation_account (conversation_id, account),
+                KEY idx_conversation_members_account (account)
+            )
+        """)
+
+    backfill_conversation_members(conn)
+
+def backfill_last_messages(conn, batch_size: int = 500) -> int:
+    """
+    Set the last message pointer of every conversation from its messages.
+    Works through conversations in small batches so it can run while the server is live.
+    Args:
+        conn: The database connection.
+        batch_size (int): Number of conversations to update per transaction.
+    Returns:
+        int: Number of conversations updated.
+    """
+    cursor = conn.cursor()
+
+    updated = 0
+    last_conversation = ""
+
+    while True:
+        cursor.execute("""
+            SELECT conversation_id FROM conversations
+            WHERE conversation_id > %s
+            ORDER BY conversation_id
+            LIMIT %s
+        """, (last_conversation, batch_size))
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+
+        if not conversation_ids:
+            break
+
+        messages.refresh_last_messages(cursor, conversation_ids)
+        conn.commit()
+
+        updated += len(conversation_ids)
+        last_conversation = conversation_ids[-1]
+
+    return updated
+
+def _add_conversation_last_message(conn) -> None:
+    # Keeps the newest message of each conversation on its row for the friends list
+    cursor = conn.cursor()
+
+    if not _column_exists(cursor, "conversations", "last_message_id"):
+        cursor.execute("""
+            ALTER TABLE conversations
+            ADD COLUMN last_message_id VARCHAR(255) NULL,
+            ADD COLUMN last_message_author VARCHAR(255) NULL,
+            ADD COLUMN last_message_preview VARCHAR(255) NULL
+        """)
+
+    if not _index_exists(cursor, "conversations", "idx_conversations_last_message_id"):
+        cursor.execute("""
+            ALTER TABLE conversations
+            ADD INDEX idx_conversations_last_message_id (last_message_id),
+            ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+    # The backfill also sets the internal id pointer, so fresh databases need it before migration 10
+    if not _column_exists(cursor, "conversations", "last_message_internal_id"):
+        cursor.execute("""
+            ALTER TABLE conversations
+            ADD COLUMN last_message_internal_id BIGINT NULL
+        """)
+
+    backfill_last_messages(conn)
+
+def _backfill_unread_counters(conn, batch_size: int = 500) -> int:
+    """
+    Recount the unread messages of every conversation member into the unread_counters table.
+    Works through conversations in small batches and overwrites existing counters.
+    Only part of migration 5: migration 7 recounts the counters from read watermarks.
+    Args:
+        conn: The database connection.
+        batch_size (int): Number of conversations to count per transaction.
+    Returns:
+        int: Number of conversations counted.
+    """
+    cursor = conn.cursor()
+
+    counted = 0
+    last_conversation = ""
+
+    while True:
+        cursor.execute("""
+            SELECT conversation_id FROM conversations
+            WHERE conversation_id > %s
+            ORDER BY conversation_id
+            LIMIT %s
+        """, (last_conversation, batch_size))
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+
+        if not conversation_ids:
+            break
+
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+        cursor.execute(f"""
+            INSERT INTO unread_counters (account, conversation_id, unread_count)
+            SELECT conversation_members.account, conversation_members.conversation_id, COUNT(messages.id)
+            FROM conversation_members
+            LEFT JOIN messages
+                ON messages.conversation_id = conversation_members.conversation_id
+                AND (messages.viewed = 0 OR messages.viewed IS NULL)
+                AND messages.author != conversation_members.account
+            WHERE conversation_members.conversation_id IN ({placeholders})
+            GROUP BY conversation_members.account, conversation_members.conversation_id
+            ON DUPLICATE KEY UPDATE unread_count = VALUES(unread_count)
+        """, conversation_ids)
+        conn.commit()
+
+        counted += len(conversation_ids)
+        last_conversation = conversation_ids[-1]
+
+    return counted
+
+def _create_unread_counters(conn) -> None:
+    # One unread message counter per member of each conversation
+    cursor = conn.cursor()
+
+    if not _table_exists(cursor, "unread_counters"):
+        cursor.execute("""
+            CREATE TABLE unread_counters (
+                account VARCHAR(255) NOT NULL,
+                conversation_id VARCHAR(255) NOT NULL,
+                unread_count INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (account, conversation_id),
+                KEY idx_unread_counters_conversation_id (conversation_id)
+            )
+        """)
+
+    _backfill_unread_counters(conn)
+
+def _add_messages_delete_time_index(conn) -> None:
+    # Lets the self-destruct scheduler load upcoming deletions without scanning messages
+    cursor = conn.cursor()
+
+    if not _index_exists(cursor, "messages", "idx_messages_delete_time"):
+        cursor.execute("""
+            ALTER TABLE messages
+            ADD INDEX idx_messages_delete_time (delete_time),
+            ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+def backfill_read_watermarks(conn, batch_size: int = 500) -> int:
+    """
+    Set the read watermark of every conversation member from the viewed flags on messages,
+    then recount their unread messages from it.
+    Works through conversations in small batches and never moves a watermark backwards,
+    so it can be re-run to correct counters that have drifted.
+    Args:
+        conn: The database connection.
+        batch_size (int): Number of conversations to update per transaction.
+    Returns:
+        int: Number of conversations updated.
+    """
+    cursor = conn.cursor()
+
+    updated = 0
+    last_conversation = ""
+
+    while True:
+        cursor.execute("""
+            SELECT conversation_id FROM conversations
+            WHERE conversation_id > %s
+            ORDER BY conversation_id
+            LIMIT %s
+        """, (last_conversation, batch_size))
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+
+        if not conversation_ids:
+            break
+
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+        # The newest message from someone else that a member has viewed
+        cursor.execute(f"""
+            INSERT INTO unread_counters (account, conversation_id, last_read_id, unread_count)
+            SELECT conversation_members.account, conversation_members.conversation_id, COALESCE(MAX(messages.id), 0), 0
+            FROM conversation_members
+            LEFT JOIN messages
+                ON messages.conversation_id = conversation_members.conversation_id
+                AND messages.viewed = 1
+                AND messages.author != conversation_members.account
+            WHERE conversation_members.conversation_id IN ({placeholders})
+            GROUP BY conversation_members.account, conversation_members.conversation_id
+            ON DUPLICATE KEY UPDATE last_read_id = GREATEST(unread_counters.last_read_id, VALUES(last_read_id))
+        """, conversation_ids)
+
+        cursor.execute(f"""
+            UPDATE unread_counters
+            SET unread_count = (
+                SELECT COUNT(*) FROM messages
+                WHERE messages.conversation_id = unread_counters.conversation_id
+                AND messages.id > unread_counters.last_read_id
+                AND messages.author != unread_counters.account
+            )
+            WHERE unread_counters.conversation_id IN ({placeholders})
+        """, conversation_ids)
+        conn.commit()
+
+        updated += len(conversation_ids)
+        last_conversation = conversation_ids[-1]
+
+    return updated
+
+def _add_read_watermarks(conn) -> None:
+    # Read state is kept as the last message each member has read instead of a flag per message
+    cursor = conn.cursor()
+
+    if not _column_exists(cursor, "unread_counters", "last_read_id"):
+        cursor.execute("""
+            ALTER TABLE unread_counters
+            ADD COLUMN last_read_id BIGINT NOT NULL DEFAULT 0
+        """)
+
+    backfill_read_watermarks(conn)
+
+def _add_push_notifications_indexes(conn) -> None:
+    # Lets push fan-outs find an account's devices and the sweep find expired ones without scanning
+    cursor = conn.cursor()
+
+    if not _index_exists(cursor, "push_notifications", "idx_push_notifications_account"):
+        cursor.execute("""
+            ALTER TABLE push_notifications
+            ADD INDEX idx_push_notifications_account (account),
+            ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+    if not _index_exists(cursor, "push_notifications", "idx_push_notifications_expires"):
+        cursor.execute("""
+            ALTER TABLE push_notifications
+            ADD INDEX idx_push_notifications_expires (expires),
+            ALGORITHM=INPLACE, LOCK=NONE
+        """)
+
+def _add_push_token_unique_key(conn) -> None:
+    # Registration upserts on the push token, so each token can only be registered once
+    cursor = conn.cursor()
+
+    if _index_exists(cursor, "push_notifications", "uq_push_notifications_push_token"):
+        return
+
+    # Collapse duplicate registrations left by the old select-then-insert into the newest one
+    # Rows are deleted in place so the kept registration keeps its id and every other column
+    cursor.execute("""
+        DELETE older FROM push_notifications AS older
+        JOIN push_notifications AS newest
+            ON newest.push_token = older.push_token
+            AND newest.id > older.id
+    """)
+    conn.commit()
+
+    cursor.execute("""
+        ALTER TABLE push_notifications
+        ADD UNIQUE KEY uq_push_notifications_push_token (push_token)
+    """)
+
+def _backfill_last_message_internal_ids(conn, batch_size: int = 500) -> None:
+    # Copy the internal id of each conversation's last message onto the conversation
+    cursor = conn.cursor()
+    last_conversation = ""
+
+    while True:
+        cursor.execute("""
+            SELECT conversation_id FROM conversations
+            WHERE conversation_id > %s
+            ORDER BY conversation_id
+            LIMIT %s
+        """, (last_conversation, batch_size))
+        conversation_ids = [row[0] for row in cursor.fetchall()]
+
+        if not conversation_ids:
+            break
+
+        placeholders = ', '.join(['%s'] * len(conversation_ids))
+
+        # Pointers a writer has already set are never moved backwards
+        cursor.execute(f"""
+            UPDATE conversations
+            JOIN messages ON messages.message_id = conversations.last_message_id
+            SET conversations.last_message_internal_id = messages.id
+            WHERE conversations.conversation_id IN ({placeholders})
+            AND (conversations.last_message_internal_id IS NULL OR conversations.last_message_internal_id < messages.id)
+        """, conversation_ids)
+        conn.commit()
+
+        last_conversation = conversation_ids[-1]
+
+def _add_conversation_last_message_internal_id(conn) -> None:
+    # Internal id of the newest message written to each conversation,
+    # so concurrent writers only ever move the last message pointer forwards
+    cursor = conn.cursor()
+
+    if not _column_exists(cursor, "conversations", "last_message_internal_id"):
+        cursor.execute("""
+            ALTER TABLE conversations
+            ADD COLUMN last_message_internal_id BIGINT NULL
+        """)
+
+    _backfill_last_message_internal_ids(conn)
+
+# Backfills that can be re-run by name from the command line
+BACKFILLS = {
+    "conversation_members": backfill_conversation_members,
+    "last_messages": backfill_last_messages,
+    "read_watermarks": backfill_read_watermarks,
+}
+
+# Ordered list of schema migrations as (version, name, function)
+# Each function receives a connection and must be safe to re-run
+MIGRATIONS = [
+    (1, "messages_conversation_index", _add_messages_conversation_index),
+    (2, "friendships", _create_friendships),
+    (3, "conversation_members", _create_conversation_members),
+    (4, "conversation_last_message", _add_conversation_last_message),
+    (5, "unread_counters", _create_unread_counters),
+    (6, "messages_delete_time_index", _add_messages_delete_time_index),
+    (7, "read_watermarks", _add_read_watermarks),
+    (8, "push_notifications_indexes", _add_push_notifications_indexes),
+    (9, "push_token_unique_key", _add_push_token_unique_key),
+    (10, "conversation_last_message_internal_id", _add_conversation_last_message_internal_id),
+]
+
+def apply_migrations() -> list:
+    """
+    Apply any schema migrations that have not been applied yet.
+    Returns:
+        list: Names of the migrations that were applied.
+    Raises:
+        MigrationLockTimeout: If another worker held the migration lock for too long.
+    """
+    # Create/ensure database connection
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    applied = []
+
+    # GET_LOCK returns 1 once the lock is held, 0 on timeout and NULL on error
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+
+    if cursor.fetchone()[0] != 1:
+        conn.close()
+        raise exceptions.MigrationLockTimeout(
+            f"Could not get the schema migration lock within {MIGRATION_LOCK_TIMEOUT} seconds."
+        )
+
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INT PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        cursor.execute("SELECT version FROM schema_migrations")
+        completed = {row[0] for row in cursor.fetchall()}
+
+        for version, name, migrate in MIGRATIONS:
+            if version in completed:
+                continue
+
+            migrate(conn)
+
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+            conn.commit()
+
+            applied.append(name)
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        conn.close()
+
+    return applied
+
+@run_in_executor
+def run_migrations() -> list:
+    """
+    Apply pending schema migrations without blocking the event loop.
+    Returns:
+        list: Names of the migrations that were applied.
+    """
+    return apply_migrations()
+
+def run_backfill(name: str) -> int:
+    """
+    Re-run a backfill by name.
+    Args:
+        name (str): The backfill name (see BACKFILLS).
+    Returns:
+        int: Number of rows added.
+    """
+    conn = get_connection()
+
+    try:
+        return BACKFILLS[name](conn)
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    # Run with: python -m app.database.migrations
+    # Re-run a backfill with: python -m app.database.migrations backfill <name>
+    config.init_config()
+
+    if len(sys.argv) == 3 and sys.argv[1] == "backfill":
+        print(f"Backfilled {run_backfill(sys.argv[2])} rows into {sys.argv[2]}")
+    else:
+        for migration in apply_migrations():
+            print(f"Applied migration: {migration}")
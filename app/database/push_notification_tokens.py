@@ -1,4 +1,57 @@
 from app.database.connections import get_connection
+from app.database.executor import run_in_executor
+from app.cache import TTLCache
+from app.websocket import bus
+import app.config as config
+
+# Bus channel used to drop push tokens that other workers have cached
+TOKENS_CHANNEL = "push_token_cache"
+
+# Cache of push tokens by account, since tokens only change on register/unregister
+_token_cache = None
+
+def get_token_cache() -> TTLCache:
+    """
+    Get the push token cache, creating it on first use.
+    Returns:
+        TTLCache: The push token cache.
+    """
+    global _token_cache
+
+    if _token_cache is None:
+        _token_cache = TTLCache(
+            maxsize=config.get_config('push-token-cache-size'),
+            ttl=config.get_config('push-token-cache-ttl'),
+        )
+
+    return _token_cache
+
+def get_token_cache_stats() -> dict:
+    """
+    Get hit/miss metrics for the push token cache.
+    Returns:
+        dict: The cache metrics.
+    """
+    return get_token_cache().stats()
+
+def _drop_tokens(accounts: list, frame: str = None) -> None:
+    for account in accounts:
+        get_token_cache().invalidate(account)
+
+# Receive invalidations published by other workers and nodes
+bus.subscribe(TOKENS_CHANNEL, _drop_tokens)
+
+async def _invalidate(accounts: list) -> None:
+    # Drop cached tokens on every worker, so a removed device stops getting pushes right away
+    if not accounts:
+        return
+
+    _drop_tokens(accounts)
+
+    try:
+        await bus.publish(TOKENS_CHANNEL, accounts, "")
+    except Exception as e:
+        print(f"Failed to publish push token invalidation to bus: {e}")
 
 async def add_mobile_notifications_device(push_token: str, account: str) -> None:
     """
@@ -13,31 +66,31 @@ async def add_mobile_notifications_device(push_token: str, account: str) -> None
     ### Returns
     None
     """
+    previous_account = await _add_mobile_notifications_device(push_token, account)
+
+    await _invalidate([account] if previous_account in (None, account) else [account, previous_account])
+
+@run_in_executor
+def _add_mobile_notifications_device(push_token: str, account: str):
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Ensure registration doesn't already exist
-    cursor.execute("SELECT push_token FROM push_notifications WHERE push_token = %s", (push_token,))
-    database_push_token = cursor.fetchone()
+        # Find who the device is registered to, so their cached tokens can be dropped if it moves
+        # Plain read: locking it would take gap locks for new tokens and deadlock concurrent registrations,
+        # and the upsert below is the only write, so a racing move only leaves a cache entry to expire
+        cursor.execute("SELECT account FROM push_notifications WHERE push_token = %s", (push_token,))
+        previous = cursor.fetchone()
 
-    if database_push_token:
-        # Update expiration date
+        # Register the device to the account, or push back its expiration date if it is already registered
         cursor.execute("""
-            UPDATE push_notifications
-            SET expires = DATE_ADD(NOW(), INTERVAL 30 DAY)
-            WHERE push_token = %s;
-        """, (push_token,))
-        conn.commit()
-    else:
-        cursor.execute("""
-            INSERT INTO push_notifications (push_token, account, expires) 
+            INSERT INTO push_notifications (push_token, account, expires)
             VALUES (%s, %s, DATE_ADD(NOW(), INTERVAL 30 DAY))
+            ON DUPLICATE KEY UPDATE account = VALUES(account), expires = VALUES(expires)
         """, (push_token, account,))
         conn.commit()
 
-    # Close db connection once complete
-    conn.close()
+    return previous[0] if previous else None
 
 async def remove_mobile_notifications_device(push_token: str) -> None:
     """
@@ -47,23 +100,87 @@ async def remove_mobile_notifications_device(push_token: str) -> None:
     ### Parameters
     - push_token: The unique identifier needed to send a notification to the device.
 
-    - account: The account the device is registered to.
-
     ### Returns
     None
     """
+    await remove_mobile_notifications_devices([push_token])
+
+async def remove_mobile_notifications_devices(push_tokens: list) -> int:
+    """
+    ## Remove Mobile Notifications Devices
+    Unregister devices that can no longer receive push notifications.
+
+    ### Parameters
+    - push_tokens: The push tokens of the devices.
+
+    ### Returns
+    int: Number of devices removed.
+    """
+    if not push_tokens:
+        return 0
+
+    removed, accounts = await _remove_mobile_notifications_devices(push_tokens)
+
+    await _invalidate(accounts)
+
+    return removed
+
+@run_in_executor
+def _remove_mobile_notifications_devices(push_tokens: list) -> tuple[int, list]:
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        placeholders = ', '.join(['%s'] * len(push_tokens))
+
+        # Find the accounts whose cached tokens need to be dropped
+        cursor.execute(
+            f"SELECT DISTINCT account FROM push_notifications WHERE push_token IN ({placeholders})",
+            list(push_tokens)
+        )
+        accounts = [row[0] for row in cursor.fetchall()]
 
-    cursor.execute("DELETE FROM push_notifications WHERE push_token = %s", (push_token,))
-    conn.commit()
-    conn.close()
+        cursor.execute(f"DELETE FROM push_notifications WHERE push_token IN ({placeholders})", list(push_tokens))
+        removed = cursor.rowcount
+        conn.commit()
+
+    return removed, accounts
+
+@run_in_executor
+def purge_expired_devices(batch_size: int = 500) -> int:
+    """
+    ## Purge Expired Devices
+    Remove devices whose registration has expired.
+    Deletes in small batches so the table isn't locked for long.
+
+    ### Parameters
+    - batch_size: Number of devices to remove per transaction.
+
+    ### Returns
+    int: Number of devices removed.
+    """
+    # Create/ensure database connection
+    with get_connection() as conn:
+        cursor = conn.cursor()
+
+        removed = 0
+
+        while True:
+            cursor.execute("DELETE FROM push_notifications WHERE expires < NOW() LIMIT %s", (batch_size,))
+            conn.commit()
+
+            removed += cursor.rowcount
+
+            if cursor.rowcount < batch_size:
+                break
+
+    return removed
 
 async def get_mobile_push_token(account: str) -> list:
     """
     ## Get Mobile Push Token
     Get the expo push token for a mobile device.
+    Tokens are cached after the first read.
 
     ### Parameters
     - account: The account you want to grab devices for.
@@ -71,14 +188,27 @@ async def get_mobile_push_token(account: str) -> list:
     ### Returns
     list: All expo push tokens for an account.
     """
+    tokens = await get_token_cache().get_or_load(
+        account,
+        lambda: _load_mobile_push_tokens(account)
+    )
+
+    # Cached as a tuple, so hand out a copy callers can change
+    return list(tokens)
+
+@run_in_executor
+def _load_mobile_push_tokens(account: str) -> tuple:
     # Create/ensure database connection
-    conn = get_connection()
-    cursor = conn.cursor()
+    with get_connection() as conn:
+        cursor = conn.cursor()
 
-    # Get all tokens from database
-    cursor.execute("SELECT push_token FROM push_notifications WHERE account = %s", (account,))
-    tokens = cursor.fetchall()
-    conn.close()
+        # Get all tokens from database
+        # Expired registrations are skipped until the sweep removes them
+        cursor.execute("""
+            SELECT push_token FROM push_notifications
+            WHERE account = %s AND (expires IS NULL OR expires >= NOW())
+        """, (account,))
+        tokens = cursor.fetchall()
 
     format_tokens = []
 
@@ -86,4 +216,4 @@ async def get_mobile_push_token(account: str) -> list:
     for token in tokens:
         format_tokens.append(token[0])
 
-    return format_tokens
\ No newline at end of file
+    return tuple(format_tokens)
\ No newline at end of file
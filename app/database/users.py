@@ -1,7 +1,9 @@
 from app.database.connections import get_connection
+from app.database.executor import run_in_executor
 from mysql.connector import connection
 
-async def search_users(user: str, db_conn: connection = None):
+@run_in_executor
+def search_users(user: str, db_conn: connection = None):
     """
     Searches the database for users.
     Parameters:
@@ -11,19 +13,21 @@ async def search_users(user: str, db_conn: connection = None):
         users (list): list of users.
     """
     # Create/ensure database connection
-    if connection is None:
+    if db_conn is None:
         conn = get_connection()
     else:
         conn = db_conn
-    cursor = conn.cursor()
 
-    cursor.execute("SELECT account FROM users WHERE account SOUNDS LIKE %s", (user,))
-    database_users = cursor.fetchall()
+    try:
+        cursor = conn.cursor()
 
-    if connection is None:
-        # Close the connection if it was created here
-        # Connections not created here are managed by the caller
-        cursor.close()
+        cursor.execute("SELECT account FROM users WHERE account SOUNDS LIKE %s", (user,))
+        database_users = cursor.fetchall()
+    finally:
+        if db_conn is None:
+            # Close the connection if it was created here
+            # Connections not created here are managed by the caller
+            conn.close()
 
     return_users = []
 
@@ -0,0 +1,72 @@
+import aiohttp
+import app.config as config
+
+# Total request timeout (in seconds) for each outbound destination
+TIMEOUTS = {
+    "auth": 10,
+    "expo": 10,
+    "giphy": 20,
+    "safe-browsing": 10,
+}
+
+_session = None
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=config.get_config('http-max-connections'),
+        limit_per_host=config.get_config('http-max-connections-per-host'),
+        keepalive_timeout=config.get_config('http-keepalive-timeout'),
+        ttl_dns_cache=300,
+    )
+
+    return aiohttp.ClientSession(connector=connector)
+
+async def start() -> None:
+    """
+    Create the application HTTP client.
+    Called from the app lifespan on startup.
+    Returns:
+        None
+    """
+    global _session
+
+    if _session is None or _session.closed:
+        _session = _create_session()
+
+async def close() -> None:
+    """
+    Close the application HTTP client and its pooled connections.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    global _session
+
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+def get_session() -> aiohttp.ClientSession:
+    """
+    Get the shared HTTP client used for all outbound requests.
+    Connections are pooled and kept alive between requests.
+    Returns:
+        aiohttp.ClientSession: The HTTP client.
+    """
+    global _session
+
+    # Fall back to creating the client here if the lifespan did not run
+    if _session is None or _session.closed:
+        _session = _create_session()
+
+    return _session
+
+def get_timeout(destination: str) -> aiohttp.ClientTimeout:
+    """
+    Get the request timeout for an outbound destination.
+    Args:
+        destination (str): The destination name (see TIMEOUTS).
+    Returns:
+        aiohttp.ClientTimeout: The timeout for requests to that destination.
+    """
+    return aiohttp.ClientTimeout(total=TIMEOUTS[destination])
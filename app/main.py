@@ -1,4 +1,5 @@
-import app.database as database
+from app.database import connections, executor, migrations, message_writer
+from app import http_client, self_destruct, push_notifications
 import sentry_sdk
 import app.config as cf
 from app.__version__ import version
@@ -7,7 +8,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import asyncio
-from app.websocket import live_updates
+from app.websocket import bus
 from app.routers import (
     legacy,
     friends,
@@ -41,35 +42,28 @@ sentry_sdk.init(
     },
 )
 
-async def destruct_messages():
-    while True:
-        # Get delete messages
-        messages = await database.get_delete_messages()
-        
-        # Notify clients to delete the message
-        for message in messages:
-            members = await database.get_members(message['conversation_id'])
-
-            await live_updates.send_message(
-                users=members,
-                message={
-                    "Type": "DELETE_MESSAGE",
-                    "Conversation_Id": message['conversation_id'],
-                    "Message_Id": message['message_id']
-                }
-            )
-
-        await database.destruct_messages()
-
-        await asyncio.sleep(10)
-
 @asynccontextmanager
 async def lifespan(application: FastAPI):
     # Code to run at startup
-    task = asyncio.create_task(destruct_messages())
+    if cf.get_config('run-migrations-on-startup'):
+        await migrations.run_migrations()
+
+    await http_client.start()
+    await bus.start()
+    message_writer.start()
+    push_notifications.start()
+    self_destruct.start()
+    config_task = asyncio.create_task(cf.watch_config())
     yield
     # Code to run at shutdown
-    task.cancel()
+    config_task.cancel()
+    await self_destruct.stop()
+    await message_writer.stop()
+    await push_notifications.stop()
+    await bus.stop()
+    await http_client.close()
+    executor.shutdown_executor()
+    connections.close_pool()
 
 
 # Create the FastAPI instance
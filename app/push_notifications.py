@@ -1,5 +1,331 @@
-from app.database import push_notification_tokens
-import requests
+from app.database import push_notification_tokens, friends
+from app import http_client, push_outbox
+import app.config as config
+import aiohttp
+import asyncio
+import orjson
+import random
+import time
+import uuid
+
+# Maximum number of messages Expo accepts in one request
+EXPO_CHUNK_SIZE = 100
+
+# Seconds a claimed chunk is hidden from other consumers while it is being sent
+CLAIM_LEASE = 60
+
+# Seconds between checks for jobs whose retry delay has passed
+POLL_INTERVAL = 1
+
+# Seconds between purges of sent jobs
+PURGE_INTERVAL = 60
+
+# Maximum number of receipts Expo returns in one request
+EXPO_RECEIPTS_CHUNK_SIZE = 1000
+
+# Expo has receipts ready about 15 minutes after sending and keeps them for a day
+RECEIPT_DELAY = 15 * 60
+RECEIPT_EXPIRY = 24 * 60 * 60
+
+# Error Expo reports for tokens that belong to uninstalled apps
+DEVICE_NOT_REGISTERED = "DeviceNotRegistered"
+
+# Set when jobs are added to the outbox, so idle workers don't wait for the next poll
+_wake = asyncio.Event()
+
+_workers = []
+_purge_task = None
+_sweep_task = None
+
+# Set once the dispatcher is stopped, so late notifications don't start the workers again
+_stopped = False
+
+# Message notifications waiting for their coalescing window to close, by (recipient, conversation, author)
+_coalescing = {}
+
+# Keep references to pending flushes so they aren't garbage collected
+_flushes = set()
+
+# Dispatcher metrics
+metrics = {
+    "sent": 0,
+    "failed": 0,
+    "retries": 0,
+    "dropped": 0,
+    "requests": 0,
+    "last_latency": 0.0,
+    "max_latency": 0.0,
+    "pruned_tokens": 0,
+    "last_sweep_pruned": 0,
+    "coalesced": 0,
+}
+
+def _retry_delay(attempt: int, retry_after: str = None) -> float:
+    # Respect the server's requested delay, otherwise back off exponentially with jitter
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+
+    return min(0.5 * 2 ** attempt, 30) * random.uniform(0.5, 1)
+
+async def _post_chunk(messages: list) -> tuple:
+    # Send one chunk to Expo
+    # Returns whether it was accepted, whether it is worth retrying, any Retry-After header
+    # and the ticket Expo issued for each message
+    session = http_client.get_session()
+    metrics['requests'] += 1
+
+    try:
+        async with session.post(
+            config.get_config('expo-push-url'),
+            json=messages,
+            timeout=http_client.get_timeout('expo')
+        ) as response:
+            body = await response.read()
+
+            if response.status < 400:
+                try:
+                    tickets = orjson.loads(body).get('data', [])
+                except (orjson.JSONDecodeError, AttributeError):
+                    tickets = []
+
+                return True, False, None, tickets
+
+            if response.status != 429 and response.status < 500:
+                print(f"Expo rejected push notifications with status {response.status}")
+                return False, False, None, []
+
+            return False, True, response.headers.get('Retry-After'), []
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        print(f"Failed to reach Expo: {e}")
+        return False, True, None, []
+
+async def _handle_tickets(jobs: list, tickets: list) -> None:
+    # Tickets are in the same order as the messages they were issued for
+    receipts = []
+    dead_tokens = []
+
+    for job, ticket in zip(jobs, tickets):
+        token = job[3]['to']
+
+        if ticket.get('status') == "ok" and ticket.get('id'):
+            receipts.append((ticket['id'], token))
+        elif ticket.get('details', {}).get('error') == DEVICE_NOT_REGISTERED:
+            dead_tokens.append(token)
+
+    if receipts:
+        await push_outbox.add_receipts(receipts)
+
+    if dead_tokens:
+        metrics['pruned_tokens'] += await push_notification_tokens.remove_mobile_notifications_devices(dead_tokens)
+
+async def _deliver(jobs: list) -> None:
+    ids = [job[0] for job in jobs]
+
+    delivered, retryable, retry_after, tickets = await _post_chunk([job[3] for job in jobs])
+
+    if delivered:
+        await push_outbox.complete(ids)
+        await _handle_tickets(jobs, tickets)
+
+        # Latency is measured from when the oldest job in the chunk was written to the outbox
+        latency = time.time() - min(job[1] for job in jobs)
+
+        metrics['sent'] += len(jobs)
+        metrics['last_latency'] = latency
+        metrics['max_latency'] = max(metrics['max_latency'], latency)
+        return
+
+    max_retries = config.get_config('push-max-retries')
+
+    if not retryable:
+        metrics['failed'] += len(jobs)
+        await push_outbox.discard(ids)
+        return
+
+    # Jobs may have joined the chunk after different numbers of attempts, so back off by attempt
+    retry_ids = {}
+    failed_ids = []
+
+    for job in jobs:
+        if job[2] < max_retries:
+            retry_ids.setdefault(job[2], []).append(job[0])
+        else:
+            failed_ids.append(job[0])
+
+    for attempt, attempt_ids in retry_ids.items():
+        metrics['retries'] += len(attempt_ids)
+        await push_outbox.retry(attempt_ids, _retry_delay(attempt, retry_after))
+
+    if failed_ids:
+        metrics['failed'] += len(failed_ids)
+        await push_outbox.discard(failed_ids)
+
+async def _work() -> None:
+    while True:
+        try:
+            jobs = await push_outbox.claim(EXPO_CHUNK_SIZE, CLAIM_LEASE)
+        except Exception as e:
+            print(f"Failed to claim push notifications: {e}")
+            jobs = []
+
+        if not jobs:
+            _wake.clear()
+
+            try:
+                await asyncio.wait_for(_wake.wait(), POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+            continue
+
+        try:
+            await _deliver(jobs)
+        except Exception as e:
+            # Claimed jobs are picked up again once their lease runs out
+            print(f"Failed to send push notifications: {e}")
+
+async def _purge() -> None:
+    while True:
+        try:
+            await push_outbox.purge_sent()
+        except Exception as e:
+            print(f"Failed to purge push outbox: {e}")
+
+        await asyncio.sleep(PURGE_INTERVAL)
+
+async def _check_receipts() -> int:
+    # Ask Expo for the receipts of sent notifications and remove tokens it reports as dead
+    pruned = 0
+    session = http_client.get_session()
+
+    while True:
+        tickets = await push_outbox.due_receipts(RECEIPT_DELAY, RECEIPT_EXPIRY, EXPO_RECEIPTS_CHUNK_SIZE)
+
+        if not tickets:
+            break
+
+        tokens = dict(tickets)
+
+        async with session.post(
+            config.get_config('expo-receipts-url'),
+            json={"ids": list(tokens)},
+            timeout=http_client.get_timeout('expo')
+        ) as response:
+            if response.status >= 400:
+                print(f"Failed to get push receipts with status {response.status}")
+                break
+
+            receipts = orjson.loads(await response.read()).get('data', {})
+
+        dead_tokens = [
+            tokens[ticket_id]
+            for ticket_id, receipt in receipts.items()
+            if ticket_id in tokens and receipt.get('details', {}).get('error') == DEVICE_NOT_REGISTERED
+        ]
+
+        pruned += await push_notification_tokens.remove_mobile_notifications_devices(dead_tokens)
+
+        # Receipts Expo doesn't have yet are checked again until they expire
+        await push_outbox.remove_receipts(list(receipts))
+
+        if len(tickets) < EXPO_RECEIPTS_CHUNK_SIZE or not receipts:
+            break
+
+    return pruned
+
+async def sweep_tokens() -> int:
+    """
+    Remove push tokens Expo reports as no longer registered, and registrations that have expired.
+    Returns:
+        int: Number of tokens removed.
+    """
+    pruned = await _check_receipts()
+    pruned += await push_notification_tokens.purge_expired_devices()
+
+    metrics['pruned_tokens'] += pruned
+    metrics['last_sweep_pruned'] = pruned
+
+    return pruned
+
+async def _sweep() -> None:
+    while True:
+        try:
+            pruned = await sweep_tokens()
+            print(f"Push token sweep removed {pruned} tokens")
+        except Exception as e:
+            print(f"Failed to sweep push tokens: {e}")
+
+        await asyncio.sleep(config.get_config('push-token-sweep-interval'))
+
+def start() -> None:
+    """
+    Start the push notification workers.
+    The number of workers caps how many requests to Expo are in flight at once.
+    Called from the app lifespan on startup.
+    Returns:
+        None
+    """
+    global _workers, _purge_task, _sweep_task, _stopped
+
+    _stopped = False
+    _workers = [task for task in _workers if not task.done()]
+
+    for _ in range(config.get_config('push-max-concurrency') - len(_workers)):
+        _workers.append(asyncio.create_task(_work()))
+
+    if _purge_task is None or _purge_task.done():
+        _purge_task = asyncio.create_task(_purge())
+
+    if _sweep_task is None or _sweep_task.done():
+        _sweep_task = asyncio.create_task(_sweep())
+
+async def stop() -> None:
+    """
+    Stop the push notification workers. Unsent jobs stay in the outbox for the next start.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    global _workers, _purge_task, _sweep_task, _stopped
+
+    _stopped = True
+
+    # Write notifications still in their coalescing window to the outbox so they survive the restart
+    for key in list(_coalescing):
+        _coalescing[key]['timer'].cancel()
+        await _flush_message_notification(key)
+
+    # Wait for flushes whose window had already closed, so none are still writing when the outbox closes
+    await asyncio.gather(*_flushes, return_exceptions=True)
+
+    tasks = _workers + [task for task in (_purge_task, _sweep_task) if task is not None]
+
+    for task in tasks:
+        task.cancel()
+
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    _workers = []
+    _purge_task = None
+    _sweep_task = None
+
+    await push_outbox.close()
+
+async def get_stats() -> dict:
+    """
+    Get push notification backlog, delivery and latency metrics.
+    Latency is the time from writing a notification to the outbox to Expo accepting it (in seconds).
+    Returns:
+        dict: The dispatcher metrics.
+    """
+    return {
+        "backlog": await push_outbox.backlog(),
+        "workers": len(_workers),
+        **metrics,
+    }
 
 async def send_push_notification(
     title: str,
@@ -7,40 +333,132 @@ async def send_push_notification(
     data: dict,
     account: str,
     badge: int = None,
+    dedupe_key: str = None,
 ) -> None:
     """
-    Send push notification to all devices of a user.
+    Write a push notification for all devices of a user to the outbox.
+    Notifications are sent by the workers in chunks shared with other users,
+    and survive restarts until they are delivered.
     Args:
         title (str): Title of the notification.
         body (str): Body of the notification.
         data (dict): Additional data to send with the notification.
         account (str): Account identifier for the user.
         badge (int): The badge count for the app.
+        dedupe_key (str): Identifies the notification, so queueing it twice only sends it once.
     Returns:
         None
     """
+    # Fall back to starting the workers here if the lifespan did not run
+    if not _workers and not _stopped:
+        start()
+
+    if dedupe_key is None:
+        dedupe_key = str(uuid.uuid4())
+
     # Get push tokens from database
     push_tokens = await push_notification_tokens.get_mobile_push_token(account)
 
-    # Check if database returned any tokens
-    if len(push_tokens) > 0:
-        # Create messages to send to clients
-        messages = []
-
-        for token in push_tokens:
-            message = {
-                'to': token,
-                'title': title,
-                'body': body,
-                'data': data,
-                'sound': 'default'
-            }
-
-            # If badge count was supplied, add it to message
-            if badge:
-                message['badge'] = badge
-
-            messages.append(message)
-        
-        # Send notifications to devices
-        requests.post("https://exp.host/--/api/v2/push/send", json=messages, timeout=10)
\ No newline at end of file
+    jobs = []
+
+    for token in push_tokens:
+        message = {
+            'to': token,
+            'title': title,
+            'body': body,
+            'data': data,
+            'sound': 'default'
+        }
+
+        # If badge count was supplied, add it to message
+        if badge:
+            message['badge'] = badge
+
+        jobs.append((f"{dedupe_key}:{token}", message))
+
+    if not jobs:
+        return
+
+    added, dropped = await push_outbox.enqueue(jobs)
+
+    # Outbox is full, shed load instead of growing it without limit
+    metrics['dropped'] += dropped
+
+    if added:
+        _wake.set()
+
+async def _flush_message_notification(key: tuple) -> None:
+    pending = _coalescing.pop(key, None)
+
+    if pending is None:
+        return
+
+    recipient, conversation_id, author = key
+
+    if pending['count'] == 1:
+        body = pending['body']
+    else:
+        body = f"{pending['count']} new messages from {author}"
+
+    # Badge is read once per window, after every message in it has been counted
+    try:
+        badge = await friends.get_unread_message_count(recipient)
+    except Exception:
+        badge = None
+
+    try:
+        await send_push_notification(
+            title=author,
+            body=body,
+            data={"conversation_id": conversation_id},
+            account=recipient,
+            badge=badge,
+            dedupe_key=f"message:{pending['message_id']}"
+        )
+    except Exception as e:
+        print(f"Failed to queue message notification: {e}")
+
+def _schedule_flush(key: tuple) -> None:
+    task = asyncio.ensure_future(_flush_message_notification(key))
+    _flushes.add(task)
+    task.add_done_callback(_flushes.discard)
+
+def notify_new_message(
+    recipient: str,
+    author: str,
+    conversation_id: str,
+    body: str,
+    message_id: str,
+) -> None:
+    """
+    Queue a push notification for a new message to an offline user.
+    Messages from the same author to the same user in the same conversation within push-coalesce-window
+    seconds are sent as one notification, such as "3 new messages from X", with the latest badge count.
+    In group conversations each author gets their own notification, so a burst is never credited to the wrong sender.
+    Args:
+        recipient (str): The user to notify.
+        author (str): The user who sent the message.
+        conversation_id (str): The conversation the message was sent to.
+        body (str): The message content.
+        message_id (str): The id of the message.
+    Returns:
+        None
+    """
+    key = (recipient, conversation_id, author)
+    pending = _coalescing.get(key)
+
+    if pending is not None:
+        pending['count'] += 1
+        pending['body'] = body
+        pending['message_id'] = message_id
+        metrics['coalesced'] += 1
+        return
+
+    loop = asyncio.get_running_loop()
+
+    _coalescing[key] = {
+        "count": 1,
+        "body": body,
+        "message_id": message_id,
+        "timer": loop.call_later(config.get_config('push-coalesce-window'), _schedule_flush, key),
+    }
@@ -0,0 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor
+import app.config as config
+import functools
+import sqlite3
+import asyncio
+import orjson
+import time
+
+# SQLite connections can't be shared between threads, so every outbox call runs on one thread
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="push-outbox")
+_conn = None
+
+# Estimate of the jobs not sent yet, so appends don't have to count the backlog
+# Other workers share the outbox file, so it is recounted when it looks full and on every purge
+_pending = None
+
+def _get_connection() -> sqlite3.Connection:
+    global _conn
+
+    if _conn is None:
+        _conn = sqlite3.connect(config.get_config('push-outbox-path'), isolation_level=None)
+
+        # Appends only need to reach the write-ahead log, and other workers can read while one writes
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("PRAGMA busy_timeout=5000")
+
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                dedupe_key TEXT NOT NULL UNIQUE,
+                message BLOB NOT NULL,
+                created_at REAL NOT NULL,
+                available_at REAL NOT NULL,
+                claimed_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                sent_at REAL
+            )
+        """)
+        _conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_outbox_pending
+            ON outbox (available_at) WHERE sent_at IS NULL
+        """)
+
+        # Expo tickets waiting for their delivery receipts
+        _conn.execute("""
+            CREATE TABLE IF NOT EXISTS receipts (
+                ticket_id TEXT PRIMARY KEY,
+                push_token TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        _conn.execute("CREATE INDEX IF NOT EXISTS idx_receipts_created_at ON receipts (created_at)")
+
+    return _conn
+
+def _run_on_outbox(func):
+    # Run a blocking outbox function on the outbox thread
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+    return wrapper
+
+def _count_pending(conn: sqlite3.Connection) -> int:
+    global _pending
+
+    _pending = conn.execute("SELECT COUNT(*) FROM outbox WHERE sent_at IS NULL").fetchone()[0]
+
+    return _pending
+
+def _room(conn: sqlite3.Connection, wanted: int) -> int:
+    # Only count the backlog when the estimate says the jobs might not fit
+    max_size = config.get_config('push-outbox-max-size')
+
+    if _pending is None or _pending + wanted > max_size:
+        _count_pending(conn)
+
+    return max(max_size - _pending, 0)
+
+def _remove_pending(count: int) -> None:
+    global _pending
+
+    if _pending is not None:
+        _pending = max(_pending - count, 0)
+
+@_run_on_outbox
+def enqueue(jobs: list) -> tuple[int, int]:
+    """
+    Append push jobs to the outbox.
+    Jobs with a dedupe key that is already in the outbox are ignored,
+    and jobs that would grow the backlog past push-outbox-max-size are dropped.
+    Args:
+        jobs (list): (dedupe key, message) for each job.
+    Returns:
+        added (int): Number of jobs added.
+        dropped (int): Number of jobs dropped because the backlog is full.
+    """
+    global _pending
+
+    conn = _get_connection()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+
+    try:
+        room = _room(conn, len(jobs))
+        added = 0
+
+        for dedupe_key, message in jobs[:room]:
+            cursor = conn.execute("""
+                INSERT OR IGNORE INTO outbox (dedupe_key, message, created_at, available_at)
+                VALUES (?, ?, ?, ?)
+            """, (dedupe_key, orjson.dumps(message), now, now))
+            added += cursor.rowcount
+
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    _pending += added
+
+    return added, max(len(jobs) - room, 0)
+
+@_run_on_outbox
+def claim(limit: int, lease: float) -> list:
+    """
+    Claim the oldest jobs that are ready to send.
+    Claimed jobs are hidden from other consumers until their lease runs out,
+    so a consumer that dies mid-send has its jobs picked up again.
+    Args:
+        limit (int): Maximum number of jobs to claim.
+        lease (float): Seconds until the claim expires.
+    Returns:
+        list: (id, created time, attempts, message) for each job.
+    """
+    conn = _get_connection()
+    now = time.time()
+
+    conn.execute("BEGIN IMMEDIATE")
+
+    try:
+        jobs = conn.execute("""
+            SELECT id, created_at, attempts, message FROM outbox
+            WHERE sent_at IS NULL
+            AND available_at <= ?
+            AND (claimed_until IS NULL OR claimed_until <= ?)
+            ORDER BY available_at
+            LIMIT ?
+        """, (now, now, limit)).fetchall()
+
+        conn.executemany(
+            "UPDATE outbox SET claimed_until = ? WHERE id = ?",
+            [(now + lease, job[0]) for job in jobs]
+        )
+
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+    return [(id, created_at, attempts, orjson.loads(message)) for id, created_at, attempts, message in jobs]
+
+@_run_on_outbox
+def complete(ids: list) -> None:
+    """
+    Mark jobs as sent. They are kept until push-outbox-dedupe-ttl passes so their dedupe keys still apply.
+    Args:
+        ids (list): Ids of the jobs.
+    Returns:
+        None
+    """
+    conn = _get_connection()
+
+    cursor = conn.executemany(
+        "UPDATE outbox SET sent_at = ?, claimed_until = NULL WHERE id = ? AND sent_at IS NULL",
+        [(time.time(), id) for id in ids]
+    )
+
+    _remove_pending(cursor.rowcount)
+
+@_run_on_outbox
+def retry(ids: list, delay: float) -> None:
+    """
+    Release jobs to be sent again after a delay.
+    Args:
+        ids (list): Ids of the jobs.
+        delay (float): Seconds to wait before the jobs can be claimed again.
+    Returns:
+        None
+    """
+    conn = _get_connection()
+
+    conn.executemany(
+        "UPDATE outbox SET available_at = ?, claimed_until = NULL, attempts = attempts + 1 WHERE id = ?",
+        [(time.time() + delay, id) for id in ids]
+    )
+
+@_run_on_outbox
+def discard(ids: list) -> None:
+    """
+    Remove jobs that can't be delivered.
+    Args:
+        ids (list): Ids of the jobs.
+    Returns:
+        None
+    """
+    conn = _get_connection()
+
+    cursor = conn.executemany("DELETE FROM outbox WHERE id = ? AND sent_at IS NULL", [(id,) for id in ids])
+
+    _remove_pending(cursor.rowcount)
+
+@_run_on_outbox
+def purge_sent() -> int:
+    """
+    Remove sent jobs whose dedupe keys have expired.
+    Returns:
+        int: Number of jobs removed.
+    """
+    conn = _get_connection()
+    cutoff = time.time() - config.get_config('push-outbox-dedupe-ttl')
+
+    cursor = conn.execute("DELETE FROM outbox WHERE sent_at IS NOT NULL AND sent_at < ?", (cutoff,))
+
+    # Pick up jobs other workers have added or sent since the last count
+    _count_pending(conn)
+
+    return cursor.rowcount
+
+@_run_on_outbox
+def add_receipts(tickets: list) -> None:
+    """
+    Remember Expo tickets so their receipts can be checked later.
+    Args:
+        tickets (list): (ticket id, push token) for each ticket.
+    Returns:
+        None
+    """
+    conn = _get_connection()
+    now = time.time()
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO receipts (ticket_id, push_token, created_at) VALUES (?, ?, ?)",
+        [(ticket_id, push_token, now) for ticket_id, push_token in tickets]
+    )
+
+@_run_on_outbox
+def due_receipts(delay: float, expiry: float, limit: int) -> list:
+    """
+    Get tickets that are old enough for Expo to have their receipts.
+    Tickets older than Expo keeps receipts for are removed.
+    Args:
+        delay (float): Seconds after sending before a receipt is checked.
+        expiry (float): Seconds after sending before a receipt is no longer available.
+        limit (int): Maximum number of tickets to return.
+    Returns:
+        list: (ticket id, push token) for each ticket, oldest first.
+    """
+    conn = _get_connection()
+    now = time.time()
+
+    conn.execute("DELETE FROM receipts WHERE created_at < ?", (now - expiry,))
+
+    return conn.execute("""
+        SELECT ticket_id, push_token FROM receipts
+        WHERE created_at <= ?
+        ORDER BY created_at
+        LIMIT ?
+    """, (now - delay, limit)).fetchall()
+
+@_run_on_outbox
+def remove_receipts(ticket_ids: list) -> None:
+    """
+    Forget tickets whose receipts have been checked.
+    Args:
+        ticket_ids (list): Ids of the tickets.
+    Returns:
+        None
+    """
+    conn = _get_connection()
+
+    conn.executemany("DELETE FROM receipts WHERE ticket_id = ?", [(ticket_id,) for ticket_id in ticket_ids])
+
+@_run_on_outbox
+def backlog() -> int:
+    """
+    Count the jobs that have not been sent yet.
+    Returns:
+        int: Number of pending jobs.
+    """
+    return _count_pending(_get_connection())
+
+@_run_on_outbox
+def close() -> None:
+    """
+    Close the outbox database.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    global _conn, _pending
+
+    if _conn is not None:
+        _conn.close()
+        _conn = None
+        _pending = None
@@ -37,7 +37,7 @@ async def add_friend(
     account = Depends(useAuth)
 ) -> responses.BasicStatusResponse:
     # Get user friends to prevent sending a friend request to friends
-    user_friends = await friends.get_friends_list(account[0])
+    user_friends = await friends.get_friends_list(account[0], include_unread=False)
 
     # Check if user is already friends with recipient
     for user in user_friends:
@@ -120,7 +120,7 @@ async def accept_friend_request(
 
     # Notify sender request was accepted (if online)
     await live_updates.send_message(
-        users=request_sender,
+        users=[request_sender],
         message={
             "Type": "FRIEND_REQUEST_ACCEPT",
             "User": username,
@@ -2,9 +2,9 @@ from fastapi import (
     APIRouter,
     HTTPException,
 )
-import requests
 from urllib.parse import quote
 import app.config as config
+from app import http_client
 
 router = APIRouter()
 
@@ -21,7 +21,8 @@ async def search_gifs(search: str = None):
     giphy_api_key = config.get_config('giphy-api-key')
 
     url = f"https://api.giphy.com/v1/gifs/search?api_key={giphy_api_key}&q={sanitized_search}&limit=20"
-    response = requests.get(url, timeout=20)
+    session = http_client.get_session()
 
-    return response.json()
+    async with session.get(url, timeout=http_client.get_timeout('giphy')) as response:
+        return await response.json()
         
\ No newline at end of file
@@ -7,8 +7,6 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect
 )
-import requests
-import asyncio
 from datetime import datetime, timezone
 from urllib.parse import quote
 from app.database import (
@@ -16,15 +14,16 @@ from app.database import (
     conversations,
     exceptions,
     messages,
+    message_writer,
     users,
-    connections,
     push_notification_tokens
 )
-from pysafebrowsing import SafeBrowsing
 import app.auth as auth
 import app.config as config
+from app import http_client, safe_browsing
 from app.websocket import live_updates, push_notifications
-from app.push_notifications import send_push_notification
+from app.websocket.view_batcher import ViewBatcher
+from app.push_notifications import send_push_notification, notify_new_message
 
 main_router = APIRouter()
        
@@ -108,7 +107,7 @@ async def add_friend_v2(
         raise HTTPException(status_code=500, detail="Internal server error.")
     
     # Get user friends to prevent sending a friend request to friends
-    user_friends = await friends.get_friends_list(username)
+    user_friends = await friends.get_friends_list(username, include_unread=False)
 
     # Check if user is already friends with recipient
     for user in user_friends:
@@ -170,7 +169,7 @@ async def accept_friend_request_v2(
 
     # Notify sender request was accepted (if online)
     await live_updates.send_message(
-        users=request_sender,
+        users=[request_sender],
         message={
             "Type": "FRIEND_REQUEST_ACCEPT",
             "User": username,
@@ -262,7 +261,7 @@ async def send_message(
     except:
         raise HTTPException(status_code=500, detail="Internal server error.")
 
-    await messages.send_message(username, conversation_id, message)
+    await message_writer.send_message(username, conversation_id, message, "False")
 
     # Get conversation members
     conversation_members = await conversations.get_members(conversation_id)
@@ -337,7 +336,7 @@ async def load_messages_v2(
             }
 
             # Mark messages as viewed
-            await messages.mark_message_viewed_bulk(conversation_name, conversation_id, offset)
+            await messages.mark_message_viewed_bulk(username, conversation_id, offset)
 
             # Check what route version the client requested
             if route_version == "2.0":
@@ -417,6 +416,7 @@ async def live_updates_route(
 
     authenticated = False
     username = None
+    view_batcher = None
 
     try:
         while True:
@@ -444,9 +444,12 @@ async def live_updates_route(
                 # Add user to connected sockets
                 await live_updates.connect_user(websocket, username)
 
+                # Views are applied in batches, so bursts while scrolling only touch the database once
+                view_batcher = ViewBatcher(websocket, username)
+
                 # Get user friends from database
                 # This will be used to send a presence update to all friends
-                friends_ = await friends.get_friends_list(username)
+                friends_ = await friends.get_friends_list(username, include_unread=False)
 
                 # Create user list based on friends list
                 # This essentially removes the conversation id from the data and just has a list of usernames
@@ -506,7 +509,7 @@ async def live_updates_route(
                                     message_type = "GIF"
                                     gif_url = data['GIF_URL']
 
-                            message_id = await messages.send_message(username, data["ConversationId"], data["Message"], self_destruct, message_type, gif_url)
+                            message_id = await message_writer.send_message(username, data["ConversationId"], data["Message"], self_destruct, message_type, gif_url)
                         except exceptions.ConversationNotFound:
                             await websocket.send_json({
                                 "ResponseType": "ERROR",
@@ -557,20 +560,15 @@ async def live_updates_route(
                             member_online = await live_updates.get_presence(member)
                             
                             # If user is not online then send a push notification to their devices
+                            # Bursts of messages are collapsed into one notification
                             if not member_online:
-                                # Attempt to get the number of unread messages the user has
-                                try:
-                                    badgeCount = friends.get_unread_message_count(member)
-                                except:
-                                    badgeCount = None
-
-                                asyncio.ensure_future(send_push_notification(
-                                    title=username, 
+                                notify_new_message(
+                                    recipient=member,
+                                    author=username,
+                                    conversation_id=data['ConversationId'],
                                     body=data['Message'],
-                                    data={"conversation_id": data['ConversationId']},
-                                    account=member,
-                                    badge=badgeCount
-                                ))
+                                    message_id=message_id
+                                )
 
                                 # If user is connected to notifications websocket service
                                 # a notification will be delivered that way
@@ -605,40 +603,8 @@ async def live_updates_route(
                         }
                     )
                 elif data["MessageType"] == "VIEW_MESSAGE":
-                    conversation_id = data['Conversation_Id']
-
-                    # Get conversation members
-                    members = await conversations.get_members(conversation_id)
-
-                    # Ensure user is a member of the conversation
-                    if username not in members:
-                        await websocket.send_json({
-                            "ResponseType": "ERROR",
-                            "ErrorCode": "NO_PERMISSION",
-                            "Detail": "You don't have permission to view this message."
-                        })
-                        continue
-
-                    # Get message from database and check to ensure the viewer is not the author
-                    message = await messages.get_message(data['Message_Id'])
-
-                    if message:
-                        if message['author'] != username:
-                            await messages.view_message(data['Message_Id'])
-
-                            await websocket.send_json({"ResponseType": "OK"})
-                        else:
-                            await websocket.send_json({
-                                "ResponseType": "ERROR",
-                                "ErrorCode": "NO_PERMISSION",
-                                "Detail": "You cannot view your own message."
-                            })
-                    else:
-                        await websocket.send_json({
-                            "ResponseType": "ERROR",
-                            "ErrorCode": "NOT_FOUND",
-                            "Detail": "Message not found."
-                        })
+                    # Membership and authorship are checked when the batch is applied
+                    view_batcher.add(data['Conversation_Id'], data['Message_Id'])
                 else:
                     await websocket.send_json({
                         "ResponseType": "ERROR",
@@ -656,7 +622,7 @@ async def live_updates_route(
             # If user is not online, send a presence update to all friends reflecting this change
             if not user_online:
                 # Get users friends
-                friends_ = await friends.get_friends_list(username)
+                friends_ = await friends.get_friends_list(username, include_unread=False)
 
                 # Make a new list of friends without the conversation ids
                 notify_users = []
@@ -673,6 +639,10 @@ async def live_updates_route(
                         "User": username
                     }
                 )
+    finally:
+        # Apply views that were still waiting for their batch, however the connection ended
+        if view_batcher is not None:
+            await view_batcher.close()
 
 @main_router.post("/register_push_notifications/{device_type}")
 async def register_push_notifications(
@@ -734,12 +704,6 @@ async def unregister_push_notifications(
 
 @main_router.post("/link_safety_check")
 async def link_safety_check(request: Request):
-    # Load API key from config
-    api_key = config.get_config('safe-browsing-api-key')
-
-    # Initialize the SafeBrowsing client
-    safe_browsing = SafeBrowsing(api_key)
-
     # Get JSON body
     body = await request.json()
 
@@ -747,7 +711,7 @@ async def link_safety_check(request: Request):
     check_url = body['url']
 
     # Lookup the URL
-    result = safe_browsing.lookup_urls([check_url])
+    result = await safe_browsing.lookup_urls([check_url])
 
     if result[check_url]['malicious']:
         return {"safe": False}
@@ -764,8 +728,10 @@ async def search_gifs(search: str = None):
         giphy_api_key = config.get_config('giphy-api-key')
 
         url = f"https://api.giphy.com/v1/gifs/search?api_key={giphy_api_key}&q={sanitized_search}&limit=20"
-        response = requests.get(url, timeout=20)
-        return response.json()
+        session = http_client.get_session()
+
+        async with session.get(url, timeout=http_client.get_timeout('giphy')) as response:
+            return await response.json()
     else:
         raise HTTPException(status_code=400, detail="No search query provided.")
     
@@ -776,17 +742,13 @@ async def user_search(
     # Accept user connection
     await websocket.accept()
 
-    # Create a database connection for user search
-    # This connection will be present for the duration of the websocket connection
-    # This is done to avoid creating a new connection for each request
-    db_conn = connections.get_connection()
-
     try:
         while True:
             data = await websocket.receive_json()
 
             if "user" in data:
-                results = await users.search_users(data['user'], db_conn)
+                # Each search borrows a pooled connection so idle sockets don't hold one
+                results = await users.search_users(data['user'])
 
                 await websocket.send_json(results)
             else:
@@ -796,13 +758,10 @@ async def user_search(
                     "detail": "Data must contain a 'user' key."
                 })
     except WebSocketDisconnect:
-        # Close the database connection when the websocket is disconnected
-        db_conn.close()
+        pass
     finally:
         if websocket.client_state.name == "CONNECTED":
             await websocket.close()
-        # Close the database connection when the websocket is disconnected
-        db_conn.close()
 
 @main_router.websocket("/live_notifications")
 async def live_notifications(websocket: WebSocket):
@@ -830,7 +789,10 @@ async def live_notifications(websocket: WebSocket):
                         continue
 
                     # Add user to push notifications sockets
-                    push_notifications.connect_user(websocket, credentials['username'])
+                    await push_notifications.connect_user(websocket, credentials['username'])
+
+                    authenticated = True
+                    user_socket = websocket
 
             elif authenticated and "credentials" not in data:
                 await websocket.send_json({"responseType": "ERROR", "errorCode": "BAD_REQUEST"})
@@ -838,13 +800,13 @@ async def live_notifications(websocket: WebSocket):
                 await websocket.send_json({"responseType": "ERROR", "errorCode": "NOT_AUTHENTICATED"})
     except WebSocketDisconnect:
         # Remove user from notification sockets
-        push_notifications.disconnect_user(user_socket)
+        await push_notifications.disconnect_user(user_socket)
     finally:
         if websocket.client_state.name == "CONNECTED":
             await websocket.close()
 
         # Remove user from notification sockets
-        push_notifications.disconnect_user(user_socket)
+        await push_notifications.disconnect_user(user_socket)
 
 @main_router.get('/app_refresh')
 async def app_refresh(request: Request, last_message_id: str = None, conversation_id: str = None):
@@ -899,10 +861,11 @@ async def app_refresh(request: Request, last_message_id: str = None, conversatio
     friends_presence = []
     
     # Get friends of user
-    friends_ = await friends.get_friends_list(username)
+    # The same list is used for presence, last messages and the friends list
+    friends_list = await friends.get_friends_list(username)
 
     # Add all online friends to list
-    for friend in friends_:
+    for friend in friends_list:
         is_online = await live_updates.get_presence(friend['Username'])
         friends_presence.append({'username': friend['Username'], 'online': is_online})
 
@@ -912,7 +875,7 @@ async def app_refresh(request: Request, last_message_id: str = None, conversatio
     conversation_ids = []
 
     # Create a list of conversation ids for each friend
-    for friend in friends:
+    for friend in friends_list:
         conversation_ids.append(friend['Id'])
 
     # Get last sent message from each conversation
@@ -921,8 +884,7 @@ async def app_refresh(request: Request, last_message_id: str = None, conversatio
     # Add last sent messages to data
     data['last_sent_messages'] = last_messages
 
-    # Get list of friends and add it to data
-    friends_list = await friends.get_friends_list(username)
+    # Add list of friends to data
     data['friends_list'] = friends_list
 
     return data
\ No newline at end of file
@@ -1,9 +1,31 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from app.database import conversations, messages, exceptions
 from app.auth import useAuth
+from typing import Optional
+import app.config as config
+import base64
 
 router = APIRouter()
 
+def encode_cursor(message_id: int) -> str:
+    """
+    Encode an internal message id into an opaque pagination cursor.
+    """
+    return base64.urlsafe_b64encode(str(message_id).encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> int:
+    """
+    Decode a pagination cursor back into an internal message id.
+    Raises:
+        ValueError: The cursor is not valid.
+    """
+    padding = "=" * (-len(cursor) % 4)
+
+    try:
+        return int(base64.urlsafe_b64decode(cursor + padding).decode())
+    except Exception:
+        raise ValueError("Invalid cursor.")
+
 @router.get("/v1/load/{conversation_id}")
 async def load_messages(
     conversation_id: str,
@@ -46,10 +68,103 @@ async def load_messages(
             }
 
             # Mark messages as viewed
-            await messages.mark_message_viewed_bulk(conversation_name, conversation_id, offset)
+            await messages.mark_message_viewed_bulk(username, conversation_id, offset)
 
             return data
         except Exception:
             raise HTTPException(status_code=500, detail="Internal Server Error")
     else:
-        raise HTTPException(status_code=403, detail="You are not a member of this conversation")
\ No newline at end of file
+        raise HTTPException(status_code=403, detail="You are not a member of this conversation")
+
+@router.get("/v2/load/{conversation_id}")
+async def load_messages_v2(
+    conversation_id: str,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    account = Depends(useAuth),
+):
+    """
+    # Load Messages (v2)
+    Load a page of messages from a conversation using cursor based pagination.
+
+    ## Request Headers
+    - `username`: The username of the user making the request.
+    - `token`: The authentication token for the user.
+
+    ## Query Parameters
+    - `cursor`: The `next_cursor` from the previous page. Leave out to load the newest messages.
+    - `limit`: Number of messages to load. Defaults to the configured page size.
+
+    ## Response
+    - `200 OK`: A page of messages and the cursor for the next (older) page. `next_cursor` is null when there are no older messages.
+    - `400 Bad Request`: If the cursor is invalid.
+    - `403 Forbidden`: If the user is not a member of the conversation.
+    - `404 Not Found`: If the conversation does not exist.
+    """
+    username = account[0]
+
+    # Decode cursor into the id to load messages before
+    before_id = None
+
+    if cursor:
+        try:
+            before_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+    # Clamp page size to the configured bounds
+    if limit is None:
+        limit = config.get_config('messages-page-size')
+
+    limit = max(1, min(limit, config.get_config('messages-max-page-size')))
+
+    try:
+        # Get all members of conversation
+        members = await conversations.get_members(conversation_id)
+    except exceptions.ConversationNotFound:
+        raise HTTPException(status_code=404, detail="Conversation Not Found")
+    except:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    # Check to ensure that the user is a member of the conversation they are trying to load
+    if username not in members:
+        raise HTTPException(status_code=403, detail="You are not a member of this conversation")
+
+    try:
+        # Get page of messages from database
+        messages_, unread_messages, id_range, has_more = await messages.get_messages_page(
+            conversation_id=conversation_id,
+            account=username,
+            before_id=before_id,
+            limit=limit
+        )
+    except exceptions.ConversationNotFound:
+        raise HTTPException(status_code=404, detail="Conversation Not Found")
+    except Exception:
+        raise HTTPException(status_code=500, detail="Internal Server Error")
+
+    # Set conversation name based on who is loading it
+    if members[0] == username:
+        conversation_name = members[1]
+    else:
+        conversation_name = members[0]
+
+    # Mark everything up to the newest message in this page as read
+    if id_range is not None:
+        await messages.mark_messages_read(username, conversation_id, id_range[1])
+
+    messages_.reverse()
+
+    # The oldest message in the page is where the next page starts
+    next_cursor = None
+
+    if has_more:
+        next_cursor = encode_cursor(id_range[0])
+
+    return {
+        "conversation_name": conversation_name,
+        "conversation_id": conversation_id,
+        "unread_messages": unread_messages,
+        "messages": messages_,
+        "next_cursor": next_cursor
+    }
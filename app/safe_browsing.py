@@ -0,0 +1,62 @@
+import app.config as config
+from app import http_client
+from app.__version__ import version
+
+SAFE_BROWSING_URL = "https://safebrowsing.googleapis.com/v4/threatMatches:find"
+
+async def lookup_urls(urls: list) -> dict:
+    """
+    Check URLs against the Google Safe Browsing API.
+    Args:
+        urls (list): The URLs to check.
+    Returns:
+        dict: Lookup result for each URL, e.g. {url: {"malicious": bool, "threats": list}}.
+    Raises:
+        aiohttp.ClientError: If there is an issue with the HTTP request.
+    """
+    # Load API key from config
+    api_key = config.get_config('safe-browsing-api-key')
+
+    body = {
+        "client": {
+            "clientId": "ringer-server",
+            "clientVersion": version
+        },
+        "threatInfo": {
+            "threatTypes": [
+                "MALWARE",
+                "SOCIAL_ENGINEERING",
+                "UNWANTED_SOFTWARE",
+                "POTENTIALLY_HARMFUL_APPLICATION"
+            ],
+            "platformTypes": ["ANY_PLATFORM"],
+            "threatEntryTypes": ["URL"],
+            "threatEntries": [{"url": url} for url in urls]
+        }
+    }
+
+    session = http_client.get_session()
+
+    async with session.post(
+        SAFE_BROWSING_URL,
+        params={"key": api_key},
+        json=body,
+        timeout=http_client.get_timeout('safe-browsing')
+    ) as response:
+        response.raise_for_status()
+        data = await response.json()
+
+    results = {}
+
+    for url in urls:
+        results[url] = {"malicious": False, "threats": []}
+
+    # Only unsafe URLs are included in the matches
+    for match in data.get("matches", []):
+        url = match["threat"]["url"]
+
+        if url in results:
+            results[url]["malicious"] = True
+            results[url]["threats"].append(match["threatType"])
+
+    return results
@@ -0,0 +1,184 @@
+from app.database import messages, conversations
+from app.websocket import live_updates
+import app.database.exceptions as exceptions
+import app.config as config
+import asyncio
+import heapq
+
+# Upcoming deletions as (deadline, internal id, conversation_id, message_id)
+# Deadlines are on the event loop clock, so they aren't affected by the system clock changing
+_heap = []
+
+# Internal ids already in the heap, so reloading a window doesn't schedule them twice
+_scheduled = set()
+
+_task = None
+
+# Scheduler metrics
+metrics = {
+    "loaded": 0,
+    "deleted": 0,
+    "batches": 0,
+    "failures": 0,
+    "last_lag": 0.0,
+    "max_lag": 0.0,
+}
+
+async def _load() -> bool:
+    # Schedule messages that are due within the next window
+    loop = asyncio.get_running_loop()
+    limit = config.get_config('self-destruct-batch-size')
+
+    due_messages = await messages.get_due_messages(config.get_config('self-destruct-window'), limit)
+    now = loop.time()
+
+    for seconds, message_id, conversation_id, message_uuid in due_messages:
+        if message_id in _scheduled:
+            continue
+
+        _scheduled.add(message_id)
+        heapq.heappush(_heap, (now + seconds, message_id, conversation_id, message_uuid))
+        metrics['loaded'] += 1
+
+    # A full result means the window has more messages than were loaded
+    return len(due_messages) == limit
+
+async def _destruct(batch: list) -> bool:
+    # Delete exactly the messages in the batch, then tell their conversations
+    # Every worker schedules the same messages, so only announce the ones this worker deleted
+    loop = asyncio.get_running_loop()
+    ids = [entry[1] for entry in batch]
+
+    try:
+        deleted = set(await messages.delete_messages(ids))
+    except Exception as e:
+        print(f"Failed to delete self-destructed messages: {e}")
+        metrics['failures'] += 1
+        return False
+    finally:
+        # Anything that wasn't deleted is picked up again by the next load
+        _scheduled.difference_update(ids)
+
+    # Batches are popped soonest first, so the first entry was waiting the longest
+    lag = max(loop.time() - batch[0][0], 0.0)
+
+    metrics['deleted'] += len(deleted)
+    metrics['batches'] += 1
+    metrics['last_lag'] = lag
+    metrics['max_lag'] = max(metrics['max_lag'], lag)
+
+    # Look up members once per conversation instead of once per message
+    by_conversation = {}
+
+    for _, message_id, conversation_id, message_uuid in batch:
+        if message_id in deleted:
+            by_conversation.setdefault(conversation_id, []).append(message_uuid)
+
+    for conversation_id, message_uuids in by_conversation.items():
+        try:
+            members = await conversations.get_members(conversation_id)
+        except exceptions.ConversationNotFound:
+            # Conversation was removed along with its messages
+            continue
+
+        # One frame per conversation, so a large batch can't overflow the members' outbound queues
+        await live_updates.send_message(
+            users=members,
+            message={
+                "Type": "DELETE_MESSAGES",
+                "Conversation_Id": conversation_id,
+                "Message_Ids": message_uuids
+            }
+        )
+
+        # Let the connection writers drain between conversations
+        await asyncio.sleep(0)
+
+    return True
+
+async def _run() -> None:
+    loop = asyncio.get_running_loop()
+    next_load = 0.0
+    truncated = False
+
+    while True:
+        if loop.time() >= next_load:
+            try:
+                truncated = await _load()
+            except Exception as e:
+                print(f"Failed to load self-destructing messages: {e}")
+                metrics['failures'] += 1
+
+            # Reload twice per window so messages viewed since the last load are never late
+            next_load = loop.time() + config.get_config('self-destruct-window') / 2
+
+        now = loop.time()
+        batch = []
+
+        while _heap and _heap[0][0] <= now and len(batch) < config.get_config('self-destruct-batch-size'):
+            batch.append(heapq.heappop(_heap))
+
+        if batch:
+            if not await _destruct(batch):
+                # Back off before retrying from the database
+                await asyncio.sleep(1)
+                next_load = 0.0
+            elif truncated and not _heap:
+                # Keep draining a backlog that didn't fit in one load
+                next_load = 0.0
+
+            continue
+
+        # Sleep until the next message is due or the window needs reloading
+        timeout = next_load - now
+
+        if _heap:
+            timeout = min(timeout, _heap[0][0] - now)
+
+        await asyncio.sleep(max(timeout, 0))
+
+def start() -> None:
+    """
+    Start the self-destruct scheduler.
+    Called from the app lifespan on startup.
+    Returns:
+        None
+    """
+    global _task
+
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_run())
+
+async def stop() -> None:
+    """
+    Stop the self-destruct scheduler.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    global _task
+
+    if _task is not None:
+        _task.cancel()
+
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+
+        _task = None
+
+    _heap.clear()
+    _scheduled.clear()
+
+def get_stats() -> dict:
+    """
+    Get self-destruct scheduler metrics.
+    Lag is how long the most overdue message in a batch waited past its delete time (in seconds).
+    Returns:
+        dict: The scheduler metrics.
+    """
+    return {
+        "scheduled": len(_heap),
+        **metrics,
+    }
@@ -0,0 +1,269 @@
+import app.config as config
+import asyncio
+import orjson
+import uuid
+
+# Redis key prefix for everything the bus stores
+KEY_PREFIX = "ringer"
+
+# How long a node is considered alive without a heartbeat (in seconds)
+NODE_TTL = 30
+
+# Functions that deliver frames to local connections, by channel
+_handlers = {}
+
+# Active bus backend
+_backend = None
+
+class LocalBus:
+    """
+    In-process bus backend.
+    Only suitable when running a single worker, since nothing leaves the process.
+    """
+    distributed = False
+
+    def __init__(self) -> None:
+        self._presence = {}
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, channel: str, users: list, frame: str) -> None:
+        # Local connections were already delivered to by the publisher
+        pass
+
+    async def set_online(self, channel: str, user: str, online: bool) -> None:
+        users = self._presence.setdefault(channel, set())
+
+        if online:
+            users.add(user)
+        else:
+            users.discard(user)
+
+    async def is_online(self, channel: str, user: str) -> bool:
+        return user in self._presence.get(channel, ())
+
+class RedisBus:
+    """
+    Redis pub/sub bus backend.
+    Every node publishes fan-outs to a shared channel and delivers the ones it receives
+    to its own connections. Presence is kept in Redis sets of node ids per user,
+    and nodes that stop sending heartbeats are ignored.
+    """
+    distributed = True
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.node_id = str(uuid.uuid4())
+
+        self._redis = None
+        self._pubsub = None
+        self._channels = {}
+        self._tasks = []
+
+        # Serialize presence updates so they reach Redis in order
+        self._presence_lock = asyncio.Lock()
+
+        # Users this node has marked as online, by channel
+        self._presence = {}
+
+    def _channel_key(self, channel: str) -> str:
+        return f"{KEY_PREFIX}:bus:{channel}"
+
+    def _presence_key(self, channel: str, user: str) -> str:
+        return f"{KEY_PREFIX}:presence:{channel}:{user}"
+
+    def _node_key(self, node_id: str) -> str:
+        return f"{KEY_PREFIX}:node:{node_id}"
+
+    async def start(self) -> None:
+        # Only needed when the Redis backend is configured
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url)
+        await self._redis.set(self._node_key(self.node_id), 1, ex=NODE_TTL)
+
+        self._channels = {self._channel_key(channel): channel for channel in _handlers}
+
+        self._pubsub = self._redis.pubsub()
+        await self._pubsub.subscribe(*self._channels)
+
+        self._tasks = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+
+        # Remove this node from the presence of its users
+        async with self._presence_lock:
+            pipeline = self._redis.pipeline()
+
+            for channel, users in self._presence.items():
+                for user in users:
+                    pipeline.srem(self._presence_key(channel, user), self.node_id)
+
+            pipeline.delete(self._node_key(self.node_id))
+            await pipeline.execute()
+
+        await self._pubsub.aclose()
+        await self._redis.aclose()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(NODE_TTL / 3)
+
+            try:
+                await self._redis.set(self._node_key(self.node_id), 1, ex=NODE_TTL)
+            except Exception as e:
+                print(f"Failed to send bus heartbeat: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+
+                    data = orjson.loads(message['data'])
+
+                    # Messages from this node were already delivered locally
+                    if data['node'] == self.node_id:
+                        continue
+
+                    channel = self._channels[message['channel'].decode()]
+                    _deliver(channel, data['users'], data['frame'])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Bus listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def publish(self, channel: str, users: list, frame: str) -> None:
+        await self._redis.publish(
+            self._channel_key(channel),
+            orjson.dumps({"node": self.node_id, "users": list(users), "frame": frame})
+        )
+
+    async def set_online(self, channel: str, user: str, online: bool) -> None:
+        key = self._presence_key(channel, user)
+        users = self._presence.setdefault(channel, set())
+
+        async with self._presence_lock:
+            if online:
+                users.add(user)
+                await self._redis.sadd(key, self.node_id)
+            else:
+                users.discard(user)
+                await self._redis.srem(key, self.node_id)
+
+    async def is_online(self, channel: str, user: str) -> bool:
+        nodes = await self._redis.smembers(self._presence_key(channel, user))
+
+        if not nodes:
+            return False
+
+        # Ignore nodes that have stopped sending heartbeats
+        alive = await self._redis.exists(*[self._node_key(node.decode()) for node in nodes])
+
+        return alive > 0
+
+def _deliver(channel: str, users: list, frame: str) -> None:
+    handler = _handlers.get(channel)
+
+    if handler is not None:
+        handler(users, frame)
+
+def subscribe(channel: str, handler) -> None:
+    """
+    Register the function that delivers frames published on a channel to local connections.
+    Must be called before the bus is started.
+    Args:
+        channel (str): The channel name.
+        handler (callable): Function that takes a list of usernames and an encoded frame.
+    Returns:
+        None
+    """
+    _handlers[channel] = handler
+
+def get_backend():
+    """
+    Get the bus backend selected by the "live-updates-backend" config option.
+    Returns:
+        LocalBus | RedisBus: The bus backend.
+    """
+    global _backend
+
+    if _backend is None:
+        if config.get_config('live-updates-backend') == "redis":
+            _backend = RedisBus(config.get_config('redis-url'))
+        else:
+            _backend = LocalBus()
+
+    return _backend
+
+def is_distributed() -> bool:
+    """
+    Check if frames are shared with other workers or nodes.
+    Returns:
+        bool: True if the bus backend is networked.
+    """
+    return get_backend().distributed
+
+async def start() -> None:
+    """
+    Start the bus backend.
+    Called from the app lifespan on startup.
+    Returns:
+        None
+    """
+    await get_backend().start()
+
+async def stop() -> None:
+    """
+    Stop the bus backend.
+    Called from the app lifespan on shutdown.
+    Returns:
+        None
+    """
+    await get_backend().stop()
+
+async def publish(channel: str, users: list, frame: str) -> None:
+    """
+    Publish a frame to the connections of a group of users on other workers and nodes.
+    Args:
+        channel (str): The channel name.
+        users (list): The usernames to deliver the frame to.
+        frame (str): The encoded frame.
+    Returns:
+        None
+    """
+    await get_backend().publish(channel, users, frame)
+
+async def set_online(channel: str, user: str, online: bool) -> None:
+    """
+    Update whether a user has connections on this node.
+    Args:
+        channel (str): The channel name.
+        user (str): The username.
+        online (bool): True if the user has at least one connection on this node.
+    Returns:
+        None
+    """
+    await get_backend().set_online(channel, user, online)
+
+async def is_online(channel: str, user: str) -> bool:
+    """
+    Check if a user is connected to any node.
+    Args:
+        channel (str): The channel name.
+        user (str): The username.
+    Returns:
+        bool: True if the user is online, False otherwise.
+    """
+    return await get_backend().is_online(channel, user)
@@ -0,0 +1,18 @@
+import orjson
+
+def encode(message) -> str:
+    """
+    Serialize a message into a WebSocket text frame.
+    Pre-encoded frames (str or bytes) are returned as text without re-encoding.
+    Args:
+        message (object | str | bytes): The message to encode.
+    Returns:
+        str: The encoded frame.
+    """
+    if isinstance(message, str):
+        return message
+
+    if isinstance(message, bytes):
+        return message.decode()
+
+    return orjson.dumps(message).decode()
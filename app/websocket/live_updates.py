@@ -1,7 +1,25 @@
 from fastapi import WebSocket
+from app.websocket.registry import ConnectionRegistry
+from app.websocket import frames, bus
 
-# Keep a list of active connections
-connections = []
+# Bus channel shared by every worker and node
+CHANNEL = "live_updates"
+
+async def _sync_presence(user: str) -> None:
+    # Tell other nodes whether the user still has connections here
+    await bus.set_online(CHANNEL, user, connections.is_online(user))
+
+# Keep an index of active connections
+connections = ConnectionRegistry(on_user_offline=_sync_presence)
+
+def _deliver(users: list, frame: str) -> None:
+    # Queue the frame on each connection's outbound queue
+    # Each connection only appears once, even if its user is listed twice
+    for connection in connections.get_connections(users):
+        connection.enqueue(frame)
+
+# Receive frames published by other workers and nodes
+bus.subscribe(CHANNEL, _deliver)
 
 async def connect_user(websocket: WebSocket, user: str) -> None:
     """
@@ -12,8 +30,13 @@ async def connect_user(websocket: WebSocket, user: str) -> None:
     Returns:
         None
     """
-    # Add the new connection to the list
-    connections.append({'user': user, 'websocket': websocket})
+    first_connection = not connections.is_online(user)
+
+    # Add the new connection to the registry
+    connections.add(websocket, user)
+
+    if first_connection:
+        await _sync_presence(user)
 
 async def disconnect_user(websocket: WebSocket) -> None:
     """
@@ -23,39 +46,38 @@ async def disconnect_user(websocket: WebSocket) -> None:
     Returns:
         None
     """
-    # Remove the connection from the list
-    for connection in connections:
-        if connection['websocket'] == websocket:
-            connections.remove(connection)
-            break
+    user = connections.get_user(websocket)
+
+    # Remove the connection from the registry, and let other nodes know once the user's last one is gone
+    # Awaited so presence checks made after the disconnect already see the user as offline
+    if connections.remove(websocket):
+        await _sync_presence(user)
 
 async def send_message(users: list, message: object) -> None:
     """
     Sends a message to a list of users.
     Args:
         users (list): A list of usernames to send the message to.
-        message (object): The message to send.
+        message (object | str | bytes): The message to send, or an already encoded frame.
     Returns:
         None
     """
-    # Keep track of connections the message has been sent to
-    sent_conns = []
-
-    # Parse through listed users and check if online
-    for user in users:
-        # Parse through active connections to check if online
-        for connection in connections:
-            if connection['user'] == user and connection['websocket'] not in sent_conns:
-                # Try to send message to user
-                # If fails, disconnect user
-                try:
-                    await connection['websocket'].send_json(message)
-                except:
-                    # Remove user from sockets list
-                    await disconnect_user(connection['websocket'])
-
-                # Add websocket to sent connections to avoid duplicate sending
-                sent_conns.append(connection['websocket'])
+    users = list(users)
+
+    # Nothing to encode if nobody can be connected to receive it
+    if not bus.is_distributed() and not connections.get_connections(users):
+        return
+
+    # Serialize the message once and share the frame with every recipient
+    frame = frames.encode(message)
+
+    # Deliver to connections on this node, then to the rest of the cluster
+    _deliver(users, frame)
+
+    try:
+        await bus.publish(CHANNEL, users, frame)
+    except Exception as e:
+        print(f"Failed to publish message to bus: {e}")
 
 async def get_presence(user: str):
     """
@@ -65,10 +87,16 @@ async def get_presence(user: str):
     Returns:
         bool: True if the user is online, False otherwise.
     """
-    # If user is on active connections return true
-    # Otherwise return false
-    for connection in connections:
-        if connection['user'] == user:
-            return True
-        
-    return False
\ No newline at end of file
+    # Check this node first to avoid a round trip to the bus
+    if connections.is_online(user):
+        return True
+
+    return await bus.is_online(CHANNEL, user)
+
+def get_stats() -> dict:
+    """
+    Gets connection, outbound queue depth and eviction metrics.
+    Returns:
+        dict: The connection metrics.
+    """
+    return connections.stats()
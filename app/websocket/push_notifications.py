@@ -1,7 +1,21 @@
 from fastapi import WebSocket
+from app.websocket.registry import ConnectionRegistry
+from app.websocket import frames, bus
 
-# Keep a list of active connections
-connections = []
+# Bus channel shared by every worker and node
+CHANNEL = "push_notifications"
+
+# Keep an index of active connections
+connections = ConnectionRegistry()
+
+def _deliver(users: list, frame: str) -> None:
+    # Queue the frame on each connection's outbound queue
+    # Each connection only appears once, even if its user is listed twice
+    for connection in connections.get_connections(users):
+        connection.enqueue(frame)
+
+# Receive frames published by other workers and nodes
+bus.subscribe(CHANNEL, _deliver)
 
 async def connect_user(websocket: WebSocket, user: str) -> None:
     """
@@ -12,8 +26,8 @@ async def connect_user(websocket: WebSocket, user: str) -> None:
     Returns:
         None
     """
-    # Add the new connection to the list
-    connections.append({'user': user, 'websocket': websocket})
+    # Add the new connection to the registry
+    connections.add(websocket, user)
 
 async def disconnect_user(websocket: WebSocket) -> None:
     """
@@ -23,36 +37,39 @@ async def disconnect_user(websocket: WebSocket) -> None:
     Returns:
         None
     """
-    # Remove the connection from the list
-    for connection in connections:
-        if connection['websocket'] == websocket:
-            connections.remove(connection)
-            break
+    # Remove the connection from the registry
+    connections.remove(websocket)
 
 async def send_notification(users: list, message: object) -> None:
     """
     Sends a notification to a list of users.
     Args:
         users (list): A list of usernames to send the notification to.
-        message (object): The message to send.
+        message (object | str | bytes): The message to send, or an already encoded frame.
     Returns:
         None
     """
-    # Keep track of connections the message has been sent to
-    sent_conns = []
-
-    # Parse through listed users and check if online
-    for user in users:
-        # Parse through active connections to check if online
-        for connection in connections:
-            if connection['user'] == user and connection['websocket'] not in sent_conns:
-                # Try to send message to user
-                # If fails, disconnect user
-                try:
-                    await connection['websocket'].send_json(message)
-                except:
-                    # Remove user from sockets list
-                    await disconnect_user(connection['websocket'])
-
-                # Add websocket to sent connections to avoid duplicate sending
-                sent_conns.append(connection['websocket'])
\ No newline at end of file
+    users = list(users)
+
+    # Nothing to encode if nobody can be connected to receive it
+    if not bus.is_distributed() and not connections.get_connections(users):
+        return
+
+    # Serialize the notification once and share the frame with every recipient
+    frame = frames.encode(message)
+
+    # Deliver to connections on this node, then to the rest of the cluster
+    _deliver(users, frame)
+
+    try:
+        await bus.publish(CHANNEL, users, frame)
+    except Exception as e:
+        print(f"Failed to publish notification to bus: {e}")
+
+def get_stats() -> dict:
+    """
+    Gets connection, outbound queue depth and eviction metrics.
+    Returns:
+        dict: The connection metrics.
+    """
+    return connections.stats()
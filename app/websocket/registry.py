@@ -0,0 +1,250 @@
+from fastapi import WebSocket
+from typing import Iterable, Optional
+import app.config as config
+import asyncio
+
+# Overflow policies for full outbound queues
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+class Connection:
+    """
+    An active WebSocket connection with its own bounded outbound queue.
+    A dedicated writer task drains the queue, so a slow client only delays its own messages.
+    """
+    def __init__(
+        self,
+        websocket: WebSocket,
+        user: str,
+        registry: "ConnectionRegistry",
+        queue_size: int,
+        overflow_policy: str
+    ) -> None:
+        self.websocket = websocket
+        self.user = user
+        self.overflow_policy = overflow_policy
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+        self._registry = registry
+        self._writer = asyncio.create_task(self._write())
+
+    def enqueue(self, frame: str) -> bool:
+        """
+        Queue an encoded frame for the connection without waiting for the network.
+        Args:
+            frame (str): The encoded message to send.
+        Returns:
+            bool: False if the connection was evicted instead of queueing the message.
+        """
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.overflow_policy == DROP_OLDEST:
+            # Make room by discarding the oldest undelivered message
+            self.queue.get_nowait()
+            self.queue.put_nowait(frame)
+            self._registry.metrics['dropped'] += 1
+            return True
+
+        # Client can't keep up, disconnect it
+        self._registry.evict(self.websocket)
+        return False
+
+    async def _write(self) -> None:
+        while True:
+            frame = await self.queue.get()
+
+            try:
+                await self.websocket.send_text(frame)
+            except Exception:
+                # Remove connection from the registry once sending fails
+                self._registry.metrics['send_failures'] += 1
+                self._registry.drop(self.websocket)
+                return
+
+    def stop(self) -> None:
+        """
+        Stop the writer task. Undelivered messages are discarded.
+        Returns:
+            None
+        """
+        if self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+class ConnectionRegistry:
+    """
+    Index of active WebSocket connections.
+    Maps each username to the set of sockets they have open and each socket back to its connection,
+    so presence checks, lookups and disconnects don't scan every connection.
+    """
+    def __init__(self, on_user_offline=None) -> None:
+        self._sockets_by_user = {}
+        self._connections = {}
+
+        # Coroutine function called with a username once their last connection is dropped
+        self._on_user_offline = on_user_offline
+
+        # Keep references to pending background tasks so they aren't garbage collected
+        self._tasks = set()
+
+        # Fan-out metrics
+        self.metrics = {
+            "dropped": 0,
+            "evictions": 0,
+            "send_failures": 0,
+        }
+
+    def add(self, websocket: WebSocket, user: str) -> Connection:
+        """
+        Register a connection for a user and start its writer task.
+        Args:
+            websocket (WebSocket): The WebSocket connection.
+            user (str): The username that owns the connection.
+        Returns:
+            Connection: The registered connection.
+        """
+        connection = Connection(
+            websocket=websocket,
+            user=user,
+            registry=self,
+            queue_size=config.get_config('websocket-queue-size'),
+            overflow_policy=config.get_config('websocket-overflow-policy'),
+        )
+
+        self._connections[websocket] = connection
+        self._sockets_by_user.setdefault(user, set()).add(websocket)
+
+        return connection
+
+    def remove(self, websocket: WebSocket) -> bool:
+        """
+        Unregister a connection and stop its writer task.
+        Args:
+            websocket (WebSocket): The WebSocket connection.
+        Returns:
+            bool: True if it was the user's last connection, so they are now offline.
+        """
+        connection = self._connections.pop(websocket, None)
+
+        if connection is None:
+            return False
+
+        connection.stop()
+
+        sockets = self._sockets_by_user.get(connection.user)
+
+        if sockets is None:
+            return False
+
+        sockets.discard(websocket)
+
+        # Drop users with no connections left so presence stays accurate
+        if sockets:
+            return False
+
+        del self._sockets_by_user[connection.user]
+
+        return True
+
+    def drop(self, websocket: WebSocket) -> None:
+        """
+        Unregister a connection that failed or fell behind, outside of any request.
+        Nothing is waiting on the disconnect, so the user's presence is updated in the background.
+        Args:
+            websocket (WebSocket): The WebSocket connection.
+        Returns:
+            None
+        """
+        user = self.get_user(websocket)
+
+        if self.remove(websocket) and self._on_user_offline is not None:
+            self._run_in_background(self._on_user_offline(user))
+
+    def _run_in_background(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def evict(self, websocket: WebSocket) -> None:
+        """
+        Unregister a slow connection and close its socket.
+        Args:
+            websocket (WebSocket): The WebSocket connection.
+        Returns:
+            None
+        """
+        if websocket not in self._connections:
+            return
+
+        self.drop(websocket)
+        self.metrics['evictions'] += 1
+
+        self._run_in_background(self._close(websocket))
+
+    async def _close(self, websocket: WebSocket) -> None:
+        try:
+            # 1013: Try Again Later
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    def get_user(self, websocket: WebSocket) -> Optional[str]:
+        """
+        Get the user that owns a connection.
+        Args:
+            websocket (WebSocket): The WebSocket connection.
+        Returns:
+            str: The username, or None if the connection is not registered.
+        """
+        connection = self._connections.get(websocket)
+
+        return connection.user if connection else None
+
+    def get_connections(self, users: Iterable[str]) -> list:
+        """
+        Get every connection owned by a group of users.
+        The result is a copy, so the registry can be changed while it is being iterated.
+        Args:
+            users (Iterable[str]): The usernames to look up.
+        Returns:
+            list: The connections, without duplicates.
+        """
+        connections = []
+
+        for user in set(users):
+            for websocket in self._sockets_by_user.get(user, ()):
+                connections.append(self._connections[websocket])
+
+        return connections
+
+    def is_online(self, user: str) -> bool:
+        """
+        Check if a user has at least one open connection.
+        Args:
+            user (str): The username to check.
+        Returns:
+            bool: True if the user is online, False otherwise.
+        """
+        return user in self._sockets_by_user
+
+    def stats(self) -> dict:
+        """
+        Get connection, queue depth and eviction metrics.
+        Returns:
+            dict: The registry metrics.
+        """
+        depths = [connection.queue.qsize() for connection in self._connections.values()]
+
+        return {
+            "connections": len(self._connections),
+            "users": len(self._sockets_by_user),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            **self.metrics,
+        }
+
+    def __len__(self) -> int:
+        return len(self._connections)
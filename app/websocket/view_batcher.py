@@ -0,0 +1,139 @@
+from fastapi import WebSocket
+from app.database import messages
+import app.config as config
+import asyncio
+
+# Flush early once this many views are waiting, however short the window is
+MAX_PENDING = 100
+
+# Error frames for views that could not be applied, sent with the ids of the affected messages
+ERRORS = {
+    "NO_PERMISSION": {
+        "ResponseType": "ERROR",
+        "ErrorCode": "NO_PERMISSION",
+        "Detail": "You don't have permission to view this message."
+    },
+    "OWN_MESSAGE": {
+        "ResponseType": "ERROR",
+        "ErrorCode": "NO_PERMISSION",
+        "Detail": "You cannot view your own message."
+    },
+    "NOT_FOUND": {
+        "ResponseType": "ERROR",
+        "ErrorCode": "NOT_FOUND",
+        "Detail": "Message not found."
+    },
+}
+
+class ViewBatcher:
+    """
+    Buffers the VIEW_MESSAGE events of one connection for a short window.
+    Each window is applied as one database update per conversation and
+    acknowledged with a single frame listing the messages that were viewed.
+    """
+    def __init__(self, websocket: WebSocket, user: str) -> None:
+        self.websocket = websocket
+        self.user = user
+
+        # Message ids waiting to be viewed, by conversation id
+        # Dicts are used as ordered sets so repeated views are only applied once
+        self._pending = {}
+        self._count = 0
+        self._flush_task = None
+
+    def add(self, conversation_id: str, message_id: str) -> None:
+        """
+        Queue a message to be marked as viewed.
+        Args:
+            conversation_id (str): The conversation the message is in.
+            message_id (str): The id of the message.
+        Returns:
+            None
+        """
+        conversation = self._pending.setdefault(conversation_id, {})
+
+        if message_id not in conversation:
+            conversation[message_id] = None
+            self._count += 1
+
+        if self._count >= MAX_PENDING:
+            self._start_flush(0)
+        elif self._flush_task is None:
+            self._start_flush(config.get_config('view-batch-window'))
+
+    def _start_flush(self, delay: float) -> None:
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+
+        self._flush_task = asyncio.create_task(self._flush_after(delay))
+
+    async def _flush_after(self, delay: float) -> None:
+        if delay:
+            await asyncio.sleep(delay)
+
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self, acknowledge: bool = True) -> None:
+        """
+        Apply every queued view.
+        Args:
+            acknowledge (bool): Whether to send the acknowledgement and error frames.
+        Returns:
+            None
+        """
+        if not self._pending:
+            return
+
+        views, self._pending, self._count = self._pending, {}, 0
+
+        try:
+            results = await messages.view_messages(self.user, views)
+        except Exception as e:
+            print(f"Failed to apply message views: {e}")
+
+            if acknowledge:
+                await self._send({
+                    "ResponseType": "ERROR",
+                    "ErrorCode": "SERVER_ERROR",
+                    "Detail": "Internal Server Error",
+                    "Message_Ids": [message_id for message_ids in views.values() for message_id in message_ids]
+                })
+            return
+
+        if not acknowledge:
+            return
+
+        # Message ids for each result, in the order they were viewed
+        by_result = {}
+
+        for message_id, result in results.items():
+            by_result.setdefault(result, []).append(message_id)
+
+        viewed = by_result.pop("OK", [])
+
+        for result, message_ids in by_result.items():
+            await self._send({**ERRORS[result], "Message_Ids": message_ids})
+
+        if viewed:
+            await self._send({"ResponseType": "OK", "Message_Ids": viewed})
+
+    async def _send(self, frame: dict) -> None:
+        try:
+            await self.websocket.send_json(frame)
+        except Exception:
+            # Connection closed before the batch was acknowledged
+            pass
+
+    async def close(self) -> None:
+        """
+        Apply any queued views without acknowledging them.
+        Called once the connection is closed.
+        Returns:
+            None
+        """
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        await self.flush(acknowledge=False)
@@ -0,0 +1,197 @@
+from unittest import IsolatedAsyncioTestCase
+from app.websocket import bus, live_updates
+import app.config as config
+import tempfile
+import asyncio
+import yaml
+import os
+
+class RedisStandIn:
+    """
+    Local stand-in for a Redis server.
+    Speaks just enough RESP for the bus: keys, sets, transactions and pub/sub.
+    """
+    def __init__(self) -> None:
+        self.data = {}
+        self.subscribers = {}
+        self.server = None
+
+    async def start(self) -> str:
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        host, port = self.server.sockets[0].getsockname()[:2]
+
+        return f"redis://{host}:{port}"
+
+    async def close(self) -> None:
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _read_command(self, reader: asyncio.StreamReader) -> list:
+        header = await reader.readline()
+
+        if not header:
+            return None
+
+        command = []
+
+        for _ in range(int(header[1:])):
+            length = int((await reader.readline())[1:])
+            command.append((await reader.readexactly(length + 2))[:-2])
+
+        return command
+
+    def _encode(self, value) -> bytes:
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, str):
+            return f"+{value}\r\n".encode()
+        if isinstance(value, (list, set)):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(item) for item in value)
+
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _execute(self, name: str, args: list):
+        if name == "SET":
+            self.data[args[0]] = args[1]
+            return "OK"
+        if name == "DEL":
+            return sum(self.data.pop(key, None) is not None for key in args)
+        if name == "EXISTS":
+            return sum(key in self.data for key in args)
+        if name == "SADD":
+            members = self.data.setdefault(args[0], set())
+            added = len(set(args[1:]) - members)
+            members.update(args[1:])
+            return added
+        if name == "SREM":
+            members = self.data.get(args[0], set())
+            removed = len(members & set(args[1:]))
+            members.difference_update(args[1:])
+            if not members:
+                self.data.pop(args[0], None)
+            return removed
+        if name == "SMEMBERS":
+            return self.data.get(args[0], set())
+        if name == "PUBLISH":
+            subscribers = self.subscribers.get(args[0], set())
+            for subscriber in subscribers:
+                subscriber.write(self._encode([b"message", args[0], args[1]]))
+            return len(subscribers)
+
+        return "OK"
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        queued = None
+
+        try:
+            while (command := await self._read_command(reader)) is not None:
+                name, args = command[0].decode().upper(), command[1:]
+
+                if name == "SUBSCRIBE":
+                    # Subscribing replies once per channel
+                    for count, channel in enumerate(args, start=1):
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(self._encode([b"subscribe", channel, count]))
+
+                    continue
+
+                if name == "MULTI":
+                    queued = []
+                    reply = "OK"
+                elif name == "EXEC":
+                    reply, queued = [self._execute(*queued_command) for queued_command in queued], None
+                elif queued is not None:
+                    queued.append((name, args))
+                    reply = "QUEUED"
+                else:
+                    reply = self._execute(name, args)
+
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            for subscribers in self.subscribers.values():
+                subscribers.discard(writer)
+
+            writer.close()
+
+class FakeWebSocket:
+    def __init__(self) -> None:
+        self.sent = []
+
+    async def send_text(self, frame: str) -> None:
+        self.sent.append(frame)
+
+class RedisBusTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.redis = RedisStandIn()
+        url = await self.redis.start()
+
+        # Run against a config file in a scratch directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+        with open("config.yml", "w") as config_file:
+            config_file.write(yaml.safe_dump({
+                **config.config_template,
+                "live-updates-backend": "redis",
+                "redis-url": url,
+            }))
+
+        config.reload_config()
+
+        # This node, and another node in the same cluster
+        bus._backend = None
+        await bus.start()
+
+        self.other_node = bus.RedisBus(url)
+        await self.other_node.start()
+
+    async def asyncTearDown(self) -> None:
+        await self.other_node.stop()
+        await bus.stop()
+        bus._backend = None
+
+        await self.redis.close()
+
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    async def test_presence_is_cleared_when_disconnect_returns(self) -> None:
+        first, second = FakeWebSocket(), FakeWebSocket()
+
+        await live_updates.connect_user(first, "ringer")
+        await live_updates.connect_user(second, "ringer")
+
+        self.assertTrue(await self.other_node.is_online(live_updates.CHANNEL, "ringer"))
+
+        # The user still has a connection open
+        await live_updates.disconnect_user(first)
+
+        self.assertTrue(await live_updates.get_presence("ringer"))
+        self.assertTrue(await self.other_node.is_online(live_updates.CHANNEL, "ringer"))
+
+        await live_updates.disconnect_user(second)
+
+        self.assertFalse(await live_updates.get_presence("ringer"))
+        self.assertFalse(await self.other_node.is_online(live_updates.CHANNEL, "ringer"))
+
+    async def test_delivers_frames_published_by_other_nodes(self) -> None:
+        websocket = FakeWebSocket()
+        await live_updates.connect_user(websocket, "ringer")
+
+        await self.other_node.publish(live_updates.CHANNEL, ["ringer"], '{"Type": "TEST"}')
+
+        for _ in range(100):
+            if websocket.sent:
+                break
+
+            await asyncio.sleep(0.01)
+
+        await live_updates.disconnect_user(websocket)
+
+        self.assertEqual(websocket.sent, ['{"Type": "TEST"}'])
@@ -0,0 +1,197 @@
+from unittest import IsolatedAsyncioTestCase, mock
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from app.database import push_notification_tokens
+from app import http_client, push_notifications, push_outbox
+import app.config as config
+import tempfile
+import asyncio
+import yaml
+import time
+import os
+
+class ExpoStandIn:
+    """
+    Local stand-in for the Expo push API.
+    Replies with the queued responses in order, then accepts everything.
+    """
+    def __init__(self) -> None:
+        self.requests = []
+        self.responses = []
+
+    async def handle(self, request: web.Request) -> web.Response:
+        messages = await request.json()
+        self.requests.append((time.monotonic(), messages))
+
+        if self.responses:
+            status, headers, errors = self.responses.pop(0)
+        else:
+            status, headers, errors = 200, {}, {}
+
+        if status >= 400:
+            return web.Response(status=status, headers=headers)
+
+        tickets = []
+
+        for index, message in enumerate(messages):
+            if message['to'] in errors:
+                tickets.append({
+                    "status": "error",
+                    "message": f"{message['to']} is not a registered push notification recipient",
+                    "details": {"error": errors[message['to']]}
+                })
+            else:
+                tickets.append({"status": "ok", "id": f"ticket-{len(self.requests)}-{index}"})
+
+        return web.json_response({"data": tickets}, headers=headers)
+
+async def wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the dispatcher")
+
+        await asyncio.sleep(0.05)
+
+class PushNotificationsTest(IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.expo = ExpoStandIn()
+
+        app = web.Application()
+        app.router.add_post("/--/api/v2/push/send", self.expo.handle)
+
+        self.server = TestServer(app)
+        await self.server.start_server()
+
+        # Run against a config file and outbox in a scratch directory
+        self.directory = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+        with open("config.yml", "w") as config_file:
+            config_file.write(yaml.safe_dump({
+                **config.config_template,
+                "expo-push-url": str(self.server.make_url("/--/api/v2/push/send")),
+                "push-outbox-path": os.path.join(self.directory.name, "push_outbox.db"),
+                "push-max-concurrency": 1,
+                "push-max-retries": 2,
+            }))
+
+        config.reload_config()
+
+        # The wake event belongs to the loop that first waits on it, and every test has its own loop
+        push_notifications._wake = asyncio.Event()
+
+        for key in push_notifications.metrics:
+            push_notifications.metrics[key] = 0
+
+        self.tokens = []
+
+        patches = [
+            mock.patch.object(push_notification_tokens, "get_mobile_push_token", side_effect=self._get_tokens),
+            mock.patch.object(push_notification_tokens, "remove_mobile_notifications_devices", return_value=0),
+            mock.patch.object(push_notification_tokens, "purge_expired_devices", return_value=0),
+        ]
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+        push_notifications.start()
+
+    async def asyncTearDown(self) -> None:
+        await push_notifications.stop()
+        await http_client.close()
+        await self.server.close()
+
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    async def _get_tokens(self, account: str) -> list:
+        return list(self.tokens)
+
+    async def _send(self) -> None:
+        await push_notifications.send_push_notification(
+            title="ringer",
+            body="Hello!",
+            data={},
+            account="ringer",
+        )
+
+    def _sent_tokens(self) -> list:
+        return [message['to'] for _, messages in self.expo.requests for message in messages]
+
+    async def test_sends_in_chunks_of_100(self) -> None:
+        self.tokens = [f"ExponentPushToken[{index}]" for index in range(250)]
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['sent'] == 250)
+
+        self.assertEqual([len(messages) for _, messages in self.expo.requests], [100, 100, 50])
+        self.assertEqual(sorted(self._sent_tokens()), sorted(self.tokens))
+
+    async def test_retries_rate_limits_after_retry_after(self) -> None:
+        self.tokens = ["ExponentPushToken[a]"]
+        self.expo.responses = [(429, {"Retry-After": "1"}, {})]
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['sent'] == 1)
+
+        (first, _), (second, _) = self.expo.requests
+
+        self.assertGreaterEqual(second - first, 1)
+        self.assertEqual(push_notifications.metrics['retries'], 1)
+
+    async def test_retries_server_errors(self) -> None:
+        self.tokens = ["ExponentPushToken[a]"]
+        self.expo.responses = [(503, {"Retry-After": "0"}, {}), (500, {"Retry-After": "0"}, {})]
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['sent'] == 1)
+
+        self.assertEqual(len(self.expo.requests), 3)
+        self.assertEqual(push_notifications.metrics['retries'], 2)
+
+    async def test_gives_up_after_max_retries(self) -> None:
+        self.tokens = ["ExponentPushToken[a]"]
+        self.expo.responses = [(503, {"Retry-After": "0"}, {})] * 3
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['failed'] == 1)
+
+        self.assertEqual(len(self.expo.requests), 3)
+        self.assertEqual(push_notifications.metrics['sent'], 0)
+
+    async def test_does_not_retry_rejected_requests(self) -> None:
+        self.tokens = ["ExponentPushToken[a]"]
+        self.expo.responses = [(400, {}, {})]
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['failed'] == 1)
+
+        self.assertEqual(len(self.expo.requests), 1)
+        self.assertEqual(push_notifications.metrics['retries'], 0)
+
+    async def test_removes_tokens_that_are_not_registered(self) -> None:
+        self.tokens = ["ExponentPushToken[live]", "ExponentPushToken[dead]"]
+        self.expo.responses = [(200, {}, {"ExponentPushToken[dead]": "DeviceNotRegistered"})]
+
+        await self._send()
+        await wait_for(lambda: push_notifications.metrics['sent'] == 2)
+
+        push_notification_tokens.remove_mobile_notifications_devices.assert_awaited_once_with(["ExponentPushToken[dead]"])
+
+        # Only the accepted message is kept to have its receipt checked
+        tickets = await push_outbox.due_receipts(0, 60, 10)
+
+        self.assertEqual([token for _, token in tickets], ["ExponentPushToken[live]"])
+
+    async def test_does_not_restart_workers_after_stop(self) -> None:
+        self.tokens = ["ExponentPushToken[a]"]
+
+        await push_notifications.stop()
+        await self._send()
+
+        self.assertEqual(push_notifications._workers, [])
+        self.assertEqual(await push_outbox.backlog(), 1)